@@ -0,0 +1,138 @@
+import argparse
+import sys
+
+import numpy as np
+
+from profiling import add_arguments, enable_from_args, stage
+from session_store import file_path, load_sessions
+from sessions import MINUTES_PER_DAY
+
+"""
+    Finds the sessions that can't all be right, instead of guessing from
+    days with more than 12h of sleep:
+        duplicate          same start and end as another session
+        overlap            starts before an earlier session has ended
+        duration_mismatch  Duration isn't Wakeup - Onset (mod 24h)
+    Every session becomes an absolute [start, end) interval in minutes;
+    sorting them by start then end (so copies end up next to each other)
+    and sweeping once with a running maximum of the ends finds all the
+    duplicates and overlaps in O(n log n).
+    The result is a table (one row per anomaly), written as csv or JSON.
+"""
+ANOMALY_KINDS = ('duplicate', 'overlap', 'duration_mismatch')
+
+
+def intervals(df):
+    """ (start, end) absolute minutes since 1970 of a typed session frame.
+        Rows without a date get -1 for both.
+    """
+    dates = df['Date'].to_numpy().astype('datetime64[m]')
+    dated = ~np.isnat(dates)
+    start = np.where(dated, dates.astype('i8'), 0) + df['Onset'].to_numpy(
+        dtype='i8')
+    end = start + df['Duration'].to_numpy(dtype='i8')
+    start[~dated], end[~dated] = -1, -1
+    return start, end
+
+
+def sweep_overlaps(start, end):
+    """ Returns (position, other, minutes, duplicate) arrays for every
+        interval that starts before an earlier one (by start, then end)
+        has ended, or is a copy of an earlier one:
+            other      the earlier interval reaching the furthest, or the
+                       copy just before it for a duplicate
+            minutes    how long they overlap
+            duplicate  same start and end as an earlier interval
+    """
+    order = np.lexsort((end, start))
+    start, end = start[order], end[order]
+    positions = np.arange(len(order))
+    # Furthest end so far, and which interval it belongs to
+    reach = np.maximum.accumulate(end)
+    holder = np.maximum.accumulate(np.where(end == reach, positions, 0))
+    before_reach = np.r_[np.iinfo('i8').min, reach[:-1]]
+    before_holder = np.r_[0, holder[:-1]]
+    duplicate = np.r_[False, (start[1:] == start[:-1])
+                      & (end[1:] == end[:-1])]
+    hits = np.flatnonzero((start < before_reach) | duplicate)
+    other = np.where(duplicate[hits], hits - 1, before_holder[hits])
+    minutes = np.minimum(end[hits], before_reach[hits]) - start[hits]
+    minutes[duplicate[hits]] = end[hits][duplicate[hits]] \
+        - start[hits][duplicate[hits]]
+    return order[hits], order[other], minutes, duplicate[hits]
+
+
+def find_anomalies(df):
+    """ Anomaly table of a typed session frame (load_sessions):
+            row        the row in the frame (and the cleaned csv)
+            line       its line in the cleaned csv
+            anomaly    one of ANOMALY_KINDS
+            start/end  the session, as datetimes
+            other_row  the row it collides with (-1 for a mismatch)
+            minutes    overlap length, or Duration - (Wakeup - Onset)
+        A row can show up once per anomaly it has.
+    """
+    import pandas as pd
+    with stage('anomalies', rows=len(df)):
+        rows = df.index.to_numpy()
+        start, end = intervals(df)
+        dated = np.flatnonzero(start >= 0)
+        position, other, overlap, duplicate = sweep_overlaps(start[dated],
+                                                             end[dated])
+        position, other = dated[position], dated[other]
+
+        onset = df['Onset'].to_numpy(dtype='i8')
+        expected = (df['Wakeup'].to_numpy(dtype='i8') - onset) \
+            % MINUTES_PER_DAY
+        duration = df['Duration'].to_numpy(dtype='i8')
+        mismatch = np.flatnonzero(duration % MINUTES_PER_DAY != expected)
+
+        found = np.r_[position, mismatch]
+        table = pd.DataFrame({
+            'row': rows[found],
+            'anomaly': pd.Categorical.from_codes(
+                np.r_[np.where(duplicate, 0, 1),
+                      np.full(len(mismatch), 2)], categories=ANOMALY_KINDS),
+            'start': start[found].astype('datetime64[m]'),
+            'end': end[found].astype('datetime64[m]'),
+            'other_row': np.r_[rows[other], np.full(len(mismatch), -1)],
+            'minutes': np.r_[overlap, duration[mismatch]
+                             - expected[mismatch]],
+        })
+        table['start'] = table['start'].where(start[found] >= 0)
+        table['end'] = table['end'].where(end[found] >= 0)
+        table.insert(1, 'line', table['row'] + 2)  # Header, 1-based
+        return table.sort_values(['row', 'anomaly'], ignore_index=True)
+
+
+def main(argv=None):
+    """ Writes the anomaly table; exits with 1 when there is one """
+    parser = argparse.ArgumentParser(
+        description="Find overlapping, duplicated and inconsistent "
+                    "sessions in the cleaned journal.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--output',
+                        help="table to write, .json for JSON records, csv "
+                             "otherwise (default: csv on stdout)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+
+    table = find_anomalies(load_sessions(args.csv))
+    if args.output is None:
+        table.to_csv(sys.stdout, index=False)
+    elif args.output.endswith('.json'):
+        table.to_json(args.output, orient='records', date_format='iso',
+                      indent=2)
+    else:
+        table.to_csv(args.output, index=False)
+    counts = table['anomaly'].value_counts()
+    print(", ".join(f"{count} {kind}" for kind, count in counts.items()),
+          file=sys.stderr)
+    if len(table):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import glob
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from csv_cleaner import START_YEAR, clean_journal
+
+"""
+    Cleans many raw journals at once, one per participant:
+        python batch_clean.py journals/ more/*.csv --store store/ \\
+            --metadata journals.json --workers 4
+    Each journal's user is its file name (alice.csv -> alice). Its first
+    year comes from the metadata file, {"alice": {"start_year": 2024}},
+    or --start-year for the users it doesn't list.
+    Journals are cleaned and summarized in a process pool, and all the
+    sessions go into one array store keyed by user (session_store
+    write_arrays, which plot_export --store reads), with summary.csv
+    next to it. A journal that fails is reported and left out; the
+    others still make it into the store.
+"""
+SUMMARY_FILE = "summary.csv"
+
+
+def find_journals(inputs):
+    """ {user: path} of the journals in directories, globs or files.
+        Cleaned journals (*_cleaned.csv) sitting next to raw ones are
+        skipped.
+    """
+    paths = []
+    for item in inputs:
+        if Path(item).is_dir():
+            paths.extend(sorted(Path(item).glob('*.csv')))
+        elif glob.has_magic(item):
+            paths.extend(Path(path) for path in sorted(glob.glob(item)))
+        else:
+            paths.append(Path(item))
+    journals = {}
+    for path in paths:
+        if path.stem.endswith('_cleaned'):
+            continue
+        if path.stem in journals and journals[path.stem] != path:
+            raise ValueError(f"Two journals for user {path.stem!r}: "
+                             f"{journals[path.stem]} and {path}")
+        journals[path.stem] = path
+    return journals
+
+
+def read_metadata(path):
+    """ {user: start_year} from a metadata file (or {} without one) """
+    if path is None:
+        return {}
+    metadata = json.loads(Path(path).read_text())
+    return {user: int(entry['start_year'])
+            for user, entry in metadata.items()}
+
+
+def process_journal(job):
+    """ Cleans, types and summarizes one journal (in a worker).
+        Returns (user, typed session frame, summary dict).
+    """
+    # Imported in the worker, after the fork or spawn
+    from anomalies import find_anomalies
+    from day_index import build_day_index
+    from session_store import type_sessions
+    from sessions import SessionArray
+
+    user, path, start_year = job
+    start = time.perf_counter()
+    cleaned = clean_journal(path, start_year)
+    df = type_sessions(cleaned)
+    sessions = SessionArray.from_frame(df)
+    days = build_day_index(sessions)
+    logged = days[days['sessions'] > 0]
+    summary = {
+        'user': user,
+        'path': str(path),
+        'start_year': start_year,
+        'sessions': len(sessions),
+        'undated': len(df) - len(sessions),
+        'first_day': str(days.index[0].date()) if len(days) else '',
+        'last_day': str(days.index[-1].date()) if len(days) else '',
+        'days_logged': len(logged),
+        'mean_daily_minutes': (float(logged['total_minutes'].mean())
+                               if len(logged) else float('nan')),
+        'night_minutes_share': (float(days['night_minutes'].sum()
+                                      / max(days['total_minutes'].sum(), 1))),
+        'anomalies': len(find_anomalies(df)),
+        'seconds': time.perf_counter() - start,
+    }
+    return user, df, summary
+
+
+def clean_batch(journals, store_dir, start_years=None,
+                default_year=START_YEAR, workers=None, log=sys.stderr):
+    """ Cleans {user: path} into one array store, in parallel.
+        Returns (summaries, failures): a summary dict per cleaned journal,
+        and {user: error message} for the ones that failed.
+    """
+    import pandas as pd
+    from session_store import write_arrays
+
+    start_years = start_years or {}
+    jobs = [(user, path, start_years.get(user, default_year))
+            for user, path in journals.items()]
+    frames, summaries, failures = {}, [], {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_journal, job): job[0] for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            user = futures[future]
+            try:
+                user, df, summary = future.result()
+            except Exception as error:  # One bad journal doesn't stop it
+                failures[user] = f"{type(error).__name__}: {error}"
+                print(f"[{done}/{len(jobs)}] {user}: FAILED, "
+                      f"{failures[user]}", file=log)
+                continue
+            frames[user] = df
+            summaries.append(summary)
+            print(f"[{done}/{len(jobs)}] {user}: {summary['sessions']} "
+                  f"sessions in {summary['seconds']:.2f}s", file=log)
+
+    # Stored in the order the journals were given, not finishing order
+    frames = {user: frames[user] for user in journals if user in frames}
+    write_arrays(store_dir, frames)
+    order = {user: position for position, user in enumerate(journals)}
+    summaries.sort(key=lambda summary: order[summary['user']])
+    pd.DataFrame(summaries).to_csv(Path(store_dir) / SUMMARY_FILE,
+                                   index=False)
+
+    seconds = time.perf_counter() - start
+    rows = sum(summary['sessions'] for summary in summaries)
+    print(f"{len(summaries)} journals cleaned, {len(failures)} failed, "
+          f"{rows} sessions in {seconds:.2f}s ({rows / seconds:.0f} "
+          f"sessions/s, {len(jobs) / seconds:.1f} journals/s)", file=log)
+    return summaries, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Clean many sleep journals into one store, in "
+                    "parallel.")
+    parser.add_argument('inputs', nargs='+',
+                        help="journal files, directories of them, or globs")
+    parser.add_argument('--store', required=True,
+                        help="directory of the array store to write")
+    parser.add_argument('--metadata',
+                        help='JSON file of {"user": {"start_year": YYYY}}')
+    parser.add_argument('--start-year', type=int, default=START_YEAR,
+                        help="first year of the journals missing from "
+                             "the metadata (default: %(default)s)")
+    parser.add_argument('--workers', type=int,
+                        help="processes to use (default: all cores)")
+    args = parser.parse_args(argv)
+
+    journals = find_journals(args.inputs)
+    if not journals:
+        parser.error("no journal found")
+    summaries, failures = clean_batch(journals, args.store,
+                                      read_metadata(args.metadata),
+                                      args.start_year, args.workers)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import csv_cleaner
+import parsers
+from heatmap import plot_heatmap
+from plot_script import plot_window
+from session_store import type_sessions
+from sessions import SessionArray
+from sleep_stats import SleepDataset, format_stats
+
+"""
+    Benchmarks for the whole pipeline, on seeded synthetic journals.
+        python benchmark.py --sizes 1000 100000 --output bench.json
+        python benchmark.py --compare old.json new.json
+        python benchmark.py --startup
+    Each stage is timed (best of --repeat runs), then run once more under
+    tracemalloc for its peak memory. The JSON report carries the commit
+    and library versions, so reports from two commits can be compared.
+    --startup times the quick commands of journal_cli.py instead, and
+    fails (exit 1) if one got slower than STARTUP_BUDGET_MS on top of a
+    bare interpreter, or started importing one of HEAVY_MODULES.
+"""
+DEFAULT_SIZES = (1_000, 100_000)  # 10_000_000 works too, give it time
+RENDER_DAYS = 365  # Rendering is timed on the last year only
+HEATMAP_DAYS = 3 * 365  # ...and the heatmap on the last three
+
+# Commands that must start fast, and what they may not import
+STARTUP_COMMANDS = {
+    'help': ['journal_cli.py', '--help'],
+    'tail': ['journal_cli.py', 'tail'],
+    'validate': ['journal_cli.py', 'validate'],
+}
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib')
+STARTUP_BUDGET_MS = 50
+
+# Two digit strings, to format numbers by indexing instead of per cell
+TWO_DIGITS = np.array([f"{i:02d}" for i in range(100)])
+
+
+def _hhmm(minutes):
+    minutes = np.asarray(minutes)
+    return np.char.add(np.char.add(TWO_DIGITS[minutes // 60], ':'),
+                       TWO_DIGITS[minutes % 60])
+
+
+def _synthetic_block(rng, rows, first_day):
+    """ One block of journal lines (list of str) and the next first day.
+        It has the journal's messiness: mostly DD/MM dates with some
+        DD/MM/YY and DD/MM/YYYY, lazily blank dates, naps, sessions past
+        midnight, NUIT BLANCHE and ,,,00:00 lines.
+    """
+    # 1 to 3 sessions a day: the night, then maybe naps
+    per_day = rng.choice([1, 2, 3], size=rows, p=[0.5, 0.35, 0.15])
+    day = first_day + np.repeat(np.arange(rows), per_day)[:rows]
+    first_of_day = np.r_[True, day[1:] != day[:-1]]
+    night = first_of_day & (rng.random(rows) < 0.9)
+    onset = np.where(night, rng.integers(21 * 60, 28 * 60, rows) % 1440,
+                     rng.integers(9 * 60, 19 * 60, rows))
+    duration = np.where(night, rng.integers(4 * 60, 10 * 60, rows),
+                        rng.integers(20, 3 * 60, rows))
+    wakeup = (onset + duration) % 1440
+
+    dates = day.astype('datetime64[D]')
+    years = dates.astype('datetime64[Y]').astype(int) + 1970
+    months = dates.astype('datetime64[M]').astype(int) % 12 + 1
+    days = (dates - dates.astype('datetime64[M]')).astype(int) + 1
+    ddmm = np.char.add(np.char.add(TWO_DIGITS[days], '/'),
+                       TWO_DIGITS[months])
+    style = rng.random(rows)
+    date_cells = np.where(
+        style < 0.10, np.char.add(ddmm, np.char.add('/', TWO_DIGITS[
+            years % 100])),
+        np.where(style < 0.25, np.char.add(ddmm, np.char.add(
+            '/', years.astype(str))), ddmm))
+    # Later sessions of a day sometimes leave the date blank
+    date_cells = np.where(~first_of_day & (rng.random(rows) < 0.3), '',
+                          date_cells)
+
+    lines = np.char.add(np.char.add(date_cells, ','), np.char.add(
+        np.char.add(_hhmm(onset), ','),
+        np.char.add(np.char.add(_hhmm(wakeup), ','), _hhmm(duration))))
+    # Sleepless days
+    dead = rng.random(rows) < 0.005
+    lines = np.where(dead, np.where(rng.random(rows) < 0.5,
+                                    'NUIT BLANCHE,,,00:00', ',,,00:00'),
+                     lines)
+    return lines.tolist(), int(day[-1]) + 1
+
+
+def write_synthetic_journal(path, rows, seed=0, start='2023-01-01',
+                            block=1_000_000):
+    """ Writes a raw journal of `rows` lines, block lines at a time.
+        The same seed always gives the same file.
+    """
+    rng = np.random.default_rng(seed)
+    first_day = int(np.datetime64(start, 'D').astype(int))
+    with open(path, 'w') as out:
+        out.write(",".join(csv_cleaner.COLUMNS) + "\n")
+        written = 0
+        while written < rows:
+            count = min(block, rows - written)
+            lines, first_day = _synthetic_block(rng, count, first_day)
+            out.write("\n".join(lines) + "\n")
+            written += count
+    return Path(path)
+
+
+def _measure(function, repeat):
+    """ (best seconds, peak traced bytes, result) of function() """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def _render(sessions, dataset):
+    fig = plot_window(sessions, days=RENDER_DAYS,
+                      thresholds=dataset.duration_thresholds)
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def _render_heatmap(sessions):
+    fig = plot_heatmap(sessions, days=HEATMAP_DAYS)
+    fig.savefig(io.BytesIO(), format='png')
+    plt.close(fig)
+
+
+def benchmark_size(rows, seed=0, repeat=3):
+    """ {stage: {seconds, rows, rows_per_s, peak_bytes}} for one size """
+    results = {}
+
+    def record(stage, function, count):
+        seconds, peak, result = _measure(function, repeat)
+        results[stage] = {'seconds': seconds, 'rows': count,
+                          'rows_per_s': count / seconds if seconds else None,
+                          'peak_bytes': peak}
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = write_synthetic_journal(Path(tmp) / "journal.csv", rows, seed)
+        frame = record('read_csv', lambda: pd.read_csv(raw, dtype=str), rows)
+        cleaned = record('year_inference', lambda: csv_cleaner.unroll_years(
+            frame, csv_cleaner.START_YEAR), rows)
+        count = len(cleaned)
+        record('parse_dates', lambda: parsers.parse_dates(cleaned['Date']),
+               count)
+        record('parse_times', lambda: [parsers.parse_hhmm(cleaned[column])
+                                       for column in ('Onset', 'Wakeup',
+                                                      'Duration')], count)
+        typed = type_sessions(cleaned.copy())
+        sessions = record('session_array',
+                          lambda: SessionArray.from_frame(typed), count)
+
+        def stats():
+            dataset = SleepDataset(sessions)
+            format_stats(dataset)
+            dataset.weekly_sleep
+            return dataset
+        dataset = record('stats', stats, count)
+        window = len(sessions.window(days=RENDER_DAYS))
+        record('render', lambda: _render(sessions, dataset), window)
+        record('heatmap', lambda: _render_heatmap(sessions),
+               len(sessions.window(days=HEATMAP_DAYS)))
+    return results
+
+
+def _start(args, repeat):
+    """ Best wall time, in ms, of a fresh interpreter running args """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=Path(__file__).parent,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _imported(args):
+    """ Top-level packages imported by running args """
+    run = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                         cwd=Path(__file__).parent, capture_output=True,
+                         text=True)
+    # import time: self [us] | cumulative | imported package
+    return {line.split('|')[-1].strip().split('.')[0]
+            for line in run.stderr.splitlines()
+            if line.startswith('import time:') and '|' in line}
+
+
+def benchmark_startup(repeat=10, budget_ms=STARTUP_BUDGET_MS):
+    """ {command: {ms, over_bare_ms, heavy_imports, ok}} for the
+        STARTUP_COMMANDS. Times are compared to a bare interpreter, as
+        python itself takes most of the time on a slow machine.
+    """
+    bare = _start(['-c', 'pass'], repeat)
+    results = {'bare_python': {'ms': bare}}
+    for name, args in STARTUP_COMMANDS.items():
+        ms = _start(args, repeat)
+        heavy = sorted(_imported(args).intersection(HEAVY_MODULES))
+        results[name] = {'ms': ms, 'over_bare_ms': ms - bare,
+                         'heavy_imports': heavy,
+                         'ok': ms - bare <= budget_ms and not heavy}
+    return results
+
+
+def format_startup(results):
+    lines = [f"{'command':<12} {'ms':>8} {'over bare':>10}  heavy imports"]
+    for name, result in results.items():
+        if name == 'bare_python':
+            lines.append(f"{name:<12} {result['ms']:>8.1f}")
+            continue
+        lines.append(f"{name:<12} {result['ms']:>8.1f} "
+                     f"{result['over_bare_ms']:>10.1f}  "
+                     f"{', '.join(result['heavy_imports']) or '-'}"
+                     f"{'' if result['ok'] else '  TOO SLOW'}")
+    return "\n".join(lines)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True,
+                              cwd=Path(__file__).parent,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, seed=0, repeat=3):
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'matplotlib': matplotlib.__version__,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'results': {},
+    }
+    for rows in sizes:
+        print(f"Benchmarking {rows} rows...", file=sys.stderr)
+        report['results'][str(rows)] = benchmark_size(rows, seed, repeat)
+    return report
+
+
+def format_report(report):
+    lines = [f"{'rows':>10} {'stage':<15} {'seconds':>9} {'rows/s':>12} "
+             f"{'peak MB':>8}"]
+    for rows, stages in report['results'].items():
+        for stage, result in stages.items():
+            lines.append(f"{rows:>10} {stage:<15} {result['seconds']:>9.4f} "
+                         f"{result['rows_per_s'] or 0:>12.0f} "
+                         f"{result['peak_bytes'] / 2**20:>8.1f}")
+    return "\n".join(lines)
+
+
+def compare_reports(old, new):
+    """ Text table of new/old time and memory ratios, stage by stage """
+    lines = [f"{old['meta']['commit']} -> {new['meta']['commit']}",
+             f"{'rows':>10} {'stage':<15} {'time x':>8} {'memory x':>9}"]
+    for rows, stages in new['results'].items():
+        for stage, result in stages.items():
+            before = old['results'].get(rows, {}).get(stage)
+            if before is None:
+                continue
+            lines.append(
+                f"{rows:>10} {stage:<15} "
+                f"{result['seconds'] / before['seconds']:>8.2f} "
+                f"{result['peak_bytes'] / max(before['peak_bytes'], 1):>9.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the cleaning, parsing, stats and plots.")
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(DEFAULT_SIZES),
+                        help="journal lengths, in lines (default: "
+                             "%(default)s; 10000000 for the big one)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark.json',
+                        help="JSON report (default: %(default)s)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two reports instead of running")
+    parser.add_argument('--startup', action='store_true',
+                        help="check the start time of the quick commands "
+                             "instead of running")
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS,
+                        help="with --startup, allowed time over a bare "
+                             "interpreter (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = benchmark_startup(args.repeat * 3, args.budget_ms)
+        print(format_startup(results))
+        if not all(result.get('ok', True) for result in results.values()):
+            sys.exit(1)
+        return
+
+    if args.compare:
+        old, new = (json.loads(Path(path).read_text())
+                    for path in args.compare)
+        print(compare_reports(old, new))
+        return
+    report = run(args.sizes, args.seed, args.repeat)
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
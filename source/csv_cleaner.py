@@ -1,6 +1,13 @@
-import pandas as pd
+import argparse
+import hashlib
+import io
+import json
 from pathlib import Path
 
+import day_index
+import session_store
+from profiling import add_arguments, enable_from_args, stage
+
 """
     This script is only meant to take the DD/MM mixed 'Date' column
     and make it use consistent DD/MM/YYYY
@@ -14,156 +21,288 @@ from pathlib import Path
     in time as their signature.
 """
 # Find sleep_journal file
+# pandas is imported by the functions that read or write csv files.
+# Nothing gets read or written on import: the functions below do the work,
+# and running this file as a script cleans the default journal.
 script_dir = Path(__file__).parent
 file_path = script_dir.parent / "assets" / "sleep_journal.csv"
+output_path = script_dir.parent / "assets" / "sleep_journal_cleaned.csv"
 
-df = pd.read_csv(file_path,
-                 parse_dates=["Date"],
-                 )
-# Because I have DD/MM and DD/MM/YYYY formats in column,
-# they all default to "string" instead.
-# The automated inferrence doesn't know how to handle
-# ambiguous DD/MM and DD/MM/YYYY coexisting
+START_YEAR = 2023  # This is when the sleep-journal starts.
+COLUMNS = ['Date', 'Onset', 'Wakeup', 'Duration']
 
 
-def standardize_date_format(date_value, year_value):
-    """ This takes the ambiguous string entries from 'Date' column and a year argument
-        and returns a string of "DD/MM/YYYY" format
+def unroll_years(df, start_year, last=None):
+    """ Takes the raw journal and returns a copy where every 'Date'
+        is a DD/MM/YYYY string.
+        This works on whole columns at once instead of walking the rows:
+            1) NUIT BLANCHE lines and ,,,00:00 lines get dropped
+               with a single boolean mask
+            2) Blank dates with times are lazily filled lines,
+               so they take the previous filled date (forward fill)
+            3) Every Dec->Jan change is a new year; a cumulative sum
+               over those changes gives the year offset of each row
+        The year written in the cell is ignored on purpose:
+        libreoffice's autocomplete backdated some of them.
+        'last' is the (day, month, year) of the last row cleaned before,
+        when only new lines are being cleaned: the filling and the
+        year counting carry on from it instead of from start_year.
     """
-    if isinstance(date_value, str):
-        parts = date_value.split('/')
-        if len(parts) == 2:  # 2 parts means DD/MM
-            day, months = parts
-            year = year_value
-            return f"{day}/{months}/{year}"
-        elif len(parts) == 3:
-            # 3 parts can mean in DD/MM/YYYY format already
-            # OR DD/MM/YY format
-            if len(parts[2]) == 4:
-                return date_value
-            elif len(parts[2]) == 2:
-                parts[2] = f"20{parts[2]}"
-                return (f"{parts[0]}/{parts[1]}/{parts[2]}")
-    else:
-        print("Called standardize_date_format with non-string date entry")
-        exit
-
-
-def split_date_str(date_string):
-    return date_string.split('/')
-
-
-def update_next_date(cur_parts, next_parts, index):
-    # This function assumes a valid cur_parts at index index
-    # It:
-    #   Check if next_parts are missing the year value
-    #   Update df with into DD/MM/YYYY value if needed
-    #   Returns the next cur_parts to be used in the loop
-    cur_day, cur_month, cur_year = cur_parts
-    if len(next_parts) == 2:
-        next_day, next_month = next_parts
-        # next_parts is DD/MM format, without year
-        # Which means we need to fill in the YYYY field.
-        if int(next_month) == 1 and int(cur_month) != 1:
-            # We are changing months INTO a new Jan month
-            # i.e. We are changing years!
-            next_year = str(int(cur_year) + 1)
-        else:
-            next_year = cur_year
-        # We now put the updated date value back in the dataframe
-        next_parts = next_day, next_month, next_year
-        df.loc[index + 1, 'Date'] = "/".join(next_parts)
-        return (next_parts)
-    elif len(next_parts) == 3:
-        if len(next_parts[2]) == 4:
-            return (next_parts)
-        elif len(next_parts[2]) == 2:
-            # We have DD/MM/YY format; extend it to DD/MM/YYYY
-            next_parts[2] = f"20{next_parts[2]}"
-            df.loc[index + 1, 'Date'] = "/".join(next_parts)
-            return (next_parts)
-    else:
-        print("You doofus, handle anomalous cells.")
-        exit
-
-
-# Initialisation
-start_year = 2023  # This is when the sleep-journal starts.
-date_val = df.at[0, 'Date']
-cur_date_str = standardize_date_format(date_val, start_year)
-df.loc[0, 'Date'] = cur_date_str  # Make sure first date is correct
-cur_day, cur_month, cur_year = split_date_str(cur_date_str)
-cur_parts = cur_day, cur_month, cur_year
-
-
-# Unrolling the remaining entries with the following assumption:
-#   Each new year has at least one January entry
-#   We do not jump from a Jan to a new Jan month
-i = 1
-stop_index = len(df)  # We have to go off the initial length
-# As we will be dropping rows in the loop.
-anomalous_date_counter = 0
-while i < stop_index:
-    next_date = df.at[i, 'Date']
+    dates = df['Date']
     # Deal with empty lines:
     # Possibilies: No sleep with NUIT BLANCHE
-    # No sleep with no date (NaN)
+    # No sleep with no date (NaN), ie a ,,,00:00 line
     # No date and sleep (assume same day as prev)
-    if next_date == "NUIT BLANCHE":
-        df = df.drop(index=i)  # Chuck it out
-        anomalous_date_counter += 1
-        i += 1
-        continue
-    elif pd.isna(next_date):
-        if pd.isna(df.at[i, 'Onset']) and pd.isna(df.at[i, 'Wakeup']):
-            # This corresponds to a ,,,00:00 line;
-            # Which amounts to a dead day without sleep.
-            df = df.drop(index=i)  # Chuck it out
-            anomalous_date_counter += 1
-            i += 1
-            continue
+    dead_day = dates.isna() & df['Onset'].isna() & df['Wakeup'].isna()
+    df = df[~(dead_day | (dates == "NUIT BLANCHE"))].reset_index(drop=True)
+    if df.empty:
+        return df
+
+    # Split the column once; DD/MM gives 2 parts, DD/MM/YY(YY) gives 3
+    # Malformed DD//MM cells are brought back to DD/MM first
+    # (reindex keeps both columns when a chunk only has blank dates)
+    parts = (df['Date'].str.replace('//', '/', regex=False)
+             .str.split('/', expand=True).reindex(columns=[0, 1]))
+    day = parts[0].ffill()
+    month = parts[1].ffill()
+    prev_month = None
+    if last is not None:
+        last_day, last_month, last_year = last
+        day = day.fillna(last_day)
+        month = month.fillna(last_month)
+        prev_month = int(last_month)
+        start_year = int(last_year)
+
+    # In plain language: a row is a Dec->Jan change if its month is 1
+    # and the previous row's month is 12.
+    # Out of order entries (ie a June line after a August one) happen,
+    # so we can't count any month decrease as a new year.
+    month_int = month.astype(int)
+    new_year = (month_int == 1) & (month_int.shift(fill_value=prev_month)
+                                   == 12)
+    year = start_year + new_year.cumsum()
+
+    df['Date'] = day + "/" + month + "/" + year.astype(str)
+    return df
+
+
+def clean_journal(path_or_buffer=file_path, start_year=START_YEAR):
+    """ Reads a raw journal (path or file-like object) and returns
+        the cleaned DataFrame, with every 'Date' as DD/MM/YYYY.
+        Onset, Wakeup and Duration are left as the HH:MM strings,
+        so the result can be written back to csv as is.
+    """
+    # Because I have DD/MM and DD/MM/YYYY formats in column,
+    # everything is read as plain strings and sorted out in unroll_years.
+    # The automated inferrence doesn't know how to handle
+    # ambiguous DD/MM and DD/MM/YYYY coexisting
+    import pandas as pd
+    with stage('read_csv') as record:
+        df = pd.read_csv(path_or_buffer, dtype=str)
+        record['rows'] = len(df)
+    # Assumptions at this point:
+    # 1) All Date entries are of format DD/MM/YYYY
+    # 2) Date entries are chronologicaly sorted - none are out of order
+    # Ergo, years unroll one at a time, on Dec->Jan changes.
+    with stage('year_inference', rows=len(df)):
+        return unroll_years(df, start_year)
+
+
+def load_journal(path_or_buffer=output_path):
+    """ Reads a cleaned journal and returns it with proper types:
+        'Date' as datetime64 (NaT if a cell isn't DD/MM/YYYY),
+        Onset, Wakeup and Duration as datetime.time
+    """
+    import pandas as pd
+    df = pd.read_csv(path_or_buffer, dtype=str)
+    df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y",
+                                errors='coerce')
+    # Columns: Index(['Date', 'Onset', 'Wakeup', 'Duration'], dtype='object')
+    # Make the Onset, Wakeup, and Duration columns use datetime format
+    for column in ('Onset', 'Wakeup', 'Duration'):
+        df[column] = pd.to_datetime(df[column], format='%H:%M').dt.time
+    return df
+
+
+def last_state(df):
+    """ Returns the (day, month, year) strings of the last cleaned row """
+    return tuple(df['Date'].iloc[-1].split('/'))
+
+
+def checkpoint_path(output):
+    """ The checkpoint lives next to the cleaned csv """
+    return Path(output).with_suffix('.checkpoint.json')
+
+
+def _output_signature(output):
+    """ (size, sha256) of the cleaned csv, so the checkpoint can tell
+        when something else (a full clean) rewrote it since
+    """
+    data = Path(output).read_bytes()
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def drop_checkpoint(output):
+    """ Called after a full or streaming clean rewrote the output: the
+        next incremental run rebuilds instead of trusting a checkpoint
+        made for the old output
+    """
+    checkpoint_path(output).unlink(missing_ok=True)
+
+
+def clean_incremental(input_path=file_path, output=output_path,
+                      start_year=START_YEAR):
+    """ Cleans only the lines appended to the journal since the last run.
+        The checkpoint remembers how many bytes of the raw journal were
+        cleaned, a hash of those bytes, and the (day, month, year) of the
+        last cleaned row, along with the size and hash of the output it
+        wrote. New lines are cleaned from that state and appended to the
+        output.
+        If the checkpoint is missing, the journal changed above it
+        (edited, shortened, other start year), or the output isn't the
+        one it wrote, it does a full rebuild.
+        Returns (new_rows, rebuilt).
+    """
+    with open(input_path, 'rb') as f:
+        data = f.read()
+    # Only complete lines are cleaned; a half written last line
+    # will be picked up on the next run.
+    end = data.rfind(b'\n') + 1
+
+    state = None
+    ckpt_file = checkpoint_path(output)
+    if ckpt_file.exists() and Path(output).exists():
+        state = json.loads(ckpt_file.read_text())
+        offset = state['offset']
+        if (state['start_year'] != start_year or offset > end
+                or hashlib.sha256(data[:offset]).hexdigest()
+                != state['sha256']):
+            state = None  # Something changed above the checkpoint
+        elif (list(_output_signature(output))
+                != [state.get('output_size'), state.get('output_sha256')]):
+            state = None  # The output was rewritten (or edited) since
+
+    if state is None:
+        df = clean_journal(io.BytesIO(data[:end]), start_year)
+        df.to_csv(output, index=False)
+        last = last_state(df) if not df.empty else None
+        rebuilt = True
+    else:
+        import pandas as pd
+        new_lines = io.BytesIO(data[state['offset']:end])
+        with stage('incremental_clean') as record:
+            df = pd.read_csv(new_lines, header=None, names=COLUMNS,
+                             dtype=str)
+            record['rows'] = len(df)
+            last = state['last']
+            df = unroll_years(df, start_year, last=last)
+            df.to_csv(output, mode='a', header=False, index=False)
+        if not df.empty:
+            last = last_state(df)
+        rebuilt = False
+
+    output_size, output_sha256 = _output_signature(output)
+    ckpt_file.write_text(json.dumps({
+        'offset': end,
+        'sha256': hashlib.sha256(data[:end]).hexdigest(),
+        'start_year': start_year,
+        'last': last,
+        'output_size': output_size,
+        'output_sha256': output_sha256,
+    }))
+    return df, rebuilt
+
+
+def update_incremental(input_path=file_path, output=output_path,
+                       start_year=START_YEAR):
+    """ clean_incremental, then brings the session cache and the day
+        index up to date with it. Returns (new rows, rebuilt) like
+        clean_incremental.
+        A save that added no complete line leaves the caches alone.
+    """
+    df, rebuilt = clean_incremental(input_path, output, start_year)
+    if not rebuilt and not len(df):
+        return df, rebuilt
+    with stage('write_cache', rows=len(df)):
+        if rebuilt:
+            typed = session_store.write_cache(output)
+            day_index.write_day_index(output, typed)
         else:
-            # We assume if there are times, it's a valid line
-            # ,Time1,Time2,Delta lines are just lazily filled ones who
-            # use the previous filled date
-            next_date = "/".join((cur_day, cur_month, cur_year))
-            df.loc[i, 'Date'] = next_date
-    parts_next_date = next_date.split('/')
-    if len(parts_next_date) == 2 or len(parts_next_date) == 3:
-        cur_day, cur_month, cur_year = update_next_date(cur_parts,
-                                                        parts_next_date,
-                                                        i - 1)
-#    print(f"Line {i} treated.")
-    i += 1
-
-df = df.reset_index(drop=True)  # Resetting indexes to be in order
-# Assumptions at this point:
-# 1) All Date entries are of format DD/MM/YYYY
-# 2) Date entries are chronologicaly sorted - none are out of order
-# Ergo, if backdating is detected, they are erroneous, and must be corrected
-
-# We now do a second pass to enforce years unroll one at a time.
-current_year = start_year
-current_month = None
-for j in range(len(df)):
-    next_date = df.at[j, 'Date']
-    next_parts = next_date.split("/")
-    next_day, next_month, next_year = next_parts
-    month_int = int(next_month)
-    if current_month is not None and month_int == 1 and int(current_month) == 12:
-        # In plain language: We are in the loop, at a Dec->Jan change
-        current_year += 1
-    if next_year != current_year:
-        # We brute force propagation unless already equal
-        df.loc[j, 'Date'] = f"{next_day}/{next_month}/{current_year}"
-    current_month = next_month
+            typed = session_store.append_sessions(output, df)
+            day_index.refresh_day_index(output, typed)
+    return df, rebuilt
 
-output_path = script_dir.parent / "assets" / "sleep_journal_cleaned.csv"
-df.to_csv(output_path, index=False)
+
+def clean_streaming(input_path=file_path, output=output_path,
+                    start_year=START_YEAR, chunksize=100_000):
+    """ Cleans the journal chunksize lines at a time, writing each cleaned
+        chunk to the output straight away, so memory doesn't grow with
+        the length of the journal.
+        The (day, month, year) of the last cleaned row is carried over to
+        the next chunk, which gives the same result as clean_journal.
+        Returns the number of cleaned rows.
+    """
+    import pandas as pd
+    last = None
+    total = 0
+    with stage('streaming_clean') as record, \
+            open(output, 'w', newline='') as out:
+        chunks = pd.read_csv(input_path, dtype=str, chunksize=chunksize)
+        for number, chunk in enumerate(chunks):
+            df = unroll_years(chunk, start_year, last=last)
+            df.to_csv(out, header=(number == 0), index=False)
+            if not df.empty:
+                last = last_state(df)
+            total += len(df)
+        record['rows'] = total
+    drop_checkpoint(output)
+    return total
+
+
+def main(argv=None):
+    """ Console entry point: python csv_cleaner.py [input] [output] """
+    parser = argparse.ArgumentParser(
+        description="Give the sleep journal consistent DD/MM/YYYY dates.")
+    parser.add_argument('input', nargs='?', default=file_path,
+                        help="raw journal csv (default: %(default)s)")
+    parser.add_argument('output', nargs='?', default=output_path,
+                        help="cleaned csv to write (default: %(default)s)")
+    parser.add_argument('--start-year', type=int, default=START_YEAR,
+                        help="year of the first journal entry")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--incremental', action='store_true',
+                      help="only clean lines added since the last run")
+    mode.add_argument('--chunksize', type=int,
+                      help="stream the journal this many lines at a time, "
+                           "for journals too big for memory (the typed "
+                           "cache is not written)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+
+    if args.chunksize:
+        count = clean_streaming(args.input, args.output, args.start_year,
+                                args.chunksize)
+        print(f"Cleaned {count} entries into {args.output}")
+        return
+
+    if args.incremental:
+        df, rebuilt = update_incremental(args.input, args.output,
+                                         args.start_year)
+        mode = "Rebuilt" if rebuilt else "Appended"
+        print(f"{mode} {len(df)} entries into {args.output}")
+        return
+    df = clean_journal(args.input, args.start_year)
+    with stage('write_csv', rows=len(df)):
+        df.to_csv(args.output, index=False)
+    drop_checkpoint(args.output)
+    # Also keep the typed cache that the loaders read first, and the
+    # calendar index next to it
+    with stage('write_cache', rows=len(df)):
+        typed = session_store.write_cache(args.output)
+        day_index.write_day_index(args.output, typed)
+    print(f"Cleaned {len(df)} entries into {args.output}")
 
 
-# Columns: Index(['Date', 'Onset', 'Wakeup', 'Duration'], dtype='object')
-# Make the Onset, Wakeup, and Duration columns use datetime format
-df['Onset'] = pd.to_datetime(df['Onset'], format='%H:%M').dt.time
-df['Wakeup'] = pd.to_datetime(df['Wakeup'], format='%H:%M').dt.time
-df['Duration'] = pd.to_datetime(df['Duration'], format='%H:%M').dt.time
+if __name__ == "__main__":
+    main()
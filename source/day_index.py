@@ -0,0 +1,213 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+from profiling import stage
+from session_store import CACHE_SUFFIX, file_path, load_sessions, meta_path
+from sessions import NAP, NIGHT, SessionArray
+
+"""
+    Calendar index of the sessions: one row per calendar day from the
+    first to the last logged one, days without sleep included:
+        total_minutes  minutes slept in sessions starting that day
+        sessions       number of sessions starting that day
+        night_minutes  the part of total_minutes from night sleep
+        nap_minutes    the part of total_minutes from naps
+    (night and nap as in sessions.classify).
+    It is kept next to the session cache (.days.pkl or .days.feather) and
+    only its last days are recomputed when sessions are appended.
+    weekly() and monthly() roll it up in O(days), so the stats don't group
+    the sessions again.
+"""
+DAY_COLUMNS = ('total_minutes', 'sessions', 'night_minutes', 'nap_minutes')
+
+
+def index_path(csv_path):
+    """ sleep_journal_cleaned.csv -> sleep_journal_cleaned.days.feather """
+    return Path(csv_path).with_suffix('.days' + CACHE_SUFFIX)
+
+
+def index_meta_path(csv_path):
+    """ The csv signature the index was built from, and its row count """
+    return Path(csv_path).with_suffix('.days.json')
+
+
+def _day_rows(sessions, first_day, last_day):
+    """ DAY_COLUMNS arrays for first_day..last_day. Sessions outside that
+        range only count as neighbours for classify().
+    """
+    import pandas as pd
+    codes = sessions.kind_codes
+    inside = (sessions.day >= first_day) & (sessions.day <= last_day)
+    position = sessions.day[inside] - first_day
+    duration = sessions.duration[inside].astype('i4')
+    codes = codes[inside]
+    days = last_day - first_day + 1
+
+    def total(weights=None):
+        return np.bincount(position, weights=weights,
+                           minlength=days).astype('i4')
+    columns = {
+        'total_minutes': total(duration),
+        'sessions': total(),
+        'night_minutes': total(np.where(codes == NIGHT, duration, 0)),
+        'nap_minutes': total(np.where(codes == NAP, duration, 0)),
+    }
+    dates = np.arange(first_day, last_day + 1).astype('datetime64[D]')
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(dates, name='Date'))
+
+
+def build_day_index(sessions):
+    """ The calendar index of a SessionArray """
+    import pandas as pd
+    if not len(sessions):
+        return pd.DataFrame(
+            {column: np.array([], dtype='i4') for column in DAY_COLUMNS},
+            index=pd.DatetimeIndex([], name='Date'))
+    with stage('day_index', rows=len(sessions)):
+        return _day_rows(sessions, int(sessions.day[0]),
+                         int(sessions.day[-1]))
+
+
+def update_day_index(index, sessions, since):
+    """ index with its days from `since` (a day number) on recomputed from
+        sessions, which must hold every session from the day before
+        `since` on. Days before `since` are kept as they are.
+    """
+    import pandas as pd
+    if not len(sessions):
+        return index
+    with stage('day_index_update', rows=len(sessions)):
+        tail = _day_rows(sessions, since, max(int(sessions.day[-1]), since))
+        kept = index[index.index < np.datetime64(since, 'D')]
+        return pd.concat([kept, tail])
+
+
+def _csv_signature(csv_path):
+    """ The signature the session cache was written with (meta_path) """
+    return json.loads(meta_path(csv_path).read_text())
+
+
+def _write_index(index, csv_path, rows):
+    path = index_path(csv_path)
+    if CACHE_SUFFIX == '.feather':
+        index.reset_index().to_feather(path)
+    else:
+        index.to_pickle(path)
+    signature = _csv_signature(csv_path)
+    index_meta_path(csv_path).write_text(json.dumps({
+        'size': signature['size'], 'sha256': signature['sha256'],
+        'rows': rows}))
+
+
+def _read_index(csv_path):
+    import pandas as pd
+    path = index_path(csv_path)
+    if CACHE_SUFFIX == '.feather':
+        return pd.read_feather(path).set_index('Date')
+    return pd.read_pickle(path)
+
+
+def write_day_index(csv_path, df):
+    """ Builds and writes the index of a typed session frame (the one
+        the session cache of csv_path was just written from)
+    """
+    index = build_day_index(SessionArray.from_frame(df))
+    _write_index(index, csv_path, len(df))
+    return index
+
+
+def refresh_day_index(csv_path, df):
+    """ Brings the index up to date with the typed session frame of
+        csv_path, after session_store.append_sessions.
+        When the csv still starts with what the index was built from and
+        the new sessions don't go back in time, only the days from the
+        last indexed one on are recomputed; otherwise it is rebuilt.
+    """
+    meta_file = index_meta_path(csv_path)
+    if index_path(csv_path).exists() and meta_file.exists():
+        meta = json.loads(meta_file.read_text())
+        prefix = Path(csv_path).read_bytes()[:meta['size']]
+        # NaT days come out as the smallest int64, below any real day
+        day = df['Date'].to_numpy().astype('datetime64[D]').astype('i8')
+        new_days = day[meta['rows']:]
+        new_days = new_days[new_days > np.iinfo('i8').min]
+        if (hashlib.sha256(prefix).hexdigest() == meta['sha256']
+                and len(df) >= meta['rows']):
+            index = _read_index(csv_path)
+            since = (int(index.index[-1].to_datetime64().astype(
+                'datetime64[D]').astype('i8')) if len(index) else None)
+            if since is not None and (not len(new_days)
+                                      or new_days.min() >= since):
+                recent = SessionArray.from_frame(df[day >= since - 1])
+                index = update_day_index(index, recent, since)
+                _write_index(index, csv_path, len(df))
+                return index
+    return write_day_index(csv_path, df)
+
+
+def load_day_index(csv_path=file_path, df=None):
+    """ The calendar index of a cleaned csv, rebuilt when it wasn't made
+        from the current session cache. df is its typed session frame,
+        when it is already loaded.
+    """
+    if df is None:
+        df = load_sessions(csv_path)
+    meta_file = index_meta_path(csv_path)
+    if index_path(csv_path).exists() and meta_file.exists():
+        meta = json.loads(meta_file.read_text())
+        signature = _csv_signature(csv_path)
+        if (meta['sha256'] == signature['sha256']
+                and meta['rows'] == len(df)):
+            with stage('read_day_index') as record:
+                index = _read_index(csv_path)
+                record['rows'] = len(index)
+            return index
+    return write_day_index(csv_path, df)
+
+
+def _rollup(index, starts):
+    """ Sums of the index over the periods beginning at the `starts`
+        positions, plus logged days and the mean minutes per logged day
+    """
+    import pandas as pd
+    values = {column: np.add.reduceat(index[column].to_numpy(), starts)
+              for column in DAY_COLUMNS}
+    logged = (index['sessions'].to_numpy() > 0).astype('i4')
+    values['days_logged'] = np.add.reduceat(logged, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values['mean_daily_minutes'] = np.where(
+            values['days_logged'] > 0,
+            values['total_minutes'] / values['days_logged'], np.nan)
+    return pd.DataFrame(values, index=index.index[starts])
+
+
+def weekly(index):
+    """ Rollup per week, Monday to Sunday like plot_export's week windows,
+        indexed by the week's Monday. The first week starts on the first
+        indexed day, which may not be a Monday.
+    """
+    if not len(index):
+        return _rollup(index, np.array([], dtype=int))
+    day = index.index.to_numpy().astype('datetime64[D]').astype('i8')
+    # Day 0 (1970-01-01) was a Thursday
+    monday = day - (day + 3) % 7
+    starts = np.flatnonzero(np.r_[True, monday[1:] != monday[:-1]])
+    rollup = _rollup(index, starts)
+    rollup.index = monday[starts].astype('datetime64[D]')
+    rollup.index.name = 'Week'
+    return rollup
+
+
+def monthly(index):
+    """ Rollup per calendar month, indexed by its first day """
+    if not len(index):
+        return _rollup(index, np.array([], dtype=int))
+    month = index.index.to_numpy().astype('datetime64[M]')
+    starts = np.flatnonzero(np.r_[True, month[1:] != month[:-1]])
+    rollup = _rollup(index, starts)
+    rollup.index = month[starts].astype('datetime64[D]')
+    rollup.index.name = 'Month'
+    return rollup
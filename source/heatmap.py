@@ -0,0 +1,115 @@
+import argparse
+
+import numpy as np
+
+from profiling import add_arguments, enable_from_args, stage
+from session_store import file_path, load_sessions
+from sessions import MINUTES_PER_DAY, SessionArray, occupancy
+
+"""
+    Whole-history overview: one row of pixels per day, one column per
+    minute (or per bin of minutes), shaded by how much of it was spent
+    asleep. Every session is painted into a uint8 raster with a
+    cumulative sum (sessions.occupancy), and the raster is drawn with a
+    single imshow, so years of journal cost about the same as a month.
+"""
+BIN_MINUTES = 5  # 288 bins a day
+HEATMAP_CMAP = 'Blues'
+
+
+def heatmap_array(sessions, first_day, last_day, bin_minutes=BIN_MINUTES):
+    """ (days, MINUTES_PER_DAY // bin_minutes) uint8 raster of the days
+        first_day..last_day: minutes asleep in each bin (sessions
+        overlapping count once). With bin_minutes=1 it is 0 or 1.
+    """
+    if MINUTES_PER_DAY % bin_minutes:
+        raise ValueError(f"bin_minutes must divide {MINUTES_PER_DAY}")
+    days = last_day - first_day + 1
+    # Sessions from the day before can run past midnight into the first row
+    lo, hi = np.searchsorted(sessions.day, [first_day - 1, last_day + 1])
+    window = sessions[lo:hi]
+    asleep = occupancy(first_day, days, window.day, window.onset,
+                       window.duration) > 0
+    if bin_minutes == 1:
+        return asleep.view('u1')
+    return asleep.reshape(days, -1, bin_minutes).sum(axis=2, dtype='u1')
+
+
+def draw_heatmap(ax, raster, day_count, bin_minutes=BIN_MINUTES):
+    """ The raster as one image, rows on the same y as the bar plot's
+        (day i of the window at y = i) and x in minutes. Returns it.
+    """
+    # Oldest day at the bottom, like the bar plot
+    return ax.imshow(raster, aspect='auto', origin='lower',
+                     interpolation='nearest', cmap=HEATMAP_CMAP,
+                     vmin=0, vmax=bin_minutes,
+                     extent=(0, MINUTES_PER_DAY, -0.5, day_count - 0.5))
+
+
+def plot_heatmap(sessions, start=None, end=None, days=None,
+                 bin_minutes=BIN_MINUTES):
+    """ Draws the heatmap of a window (picked like plot_window, the whole
+        history by default) as one image. Returns the figure.
+    """
+    import matplotlib.pyplot as plt
+    first_day, last_day = sessions.window_bounds(start, end, days)
+    if first_day is None:
+        first_day = int(sessions.day[0]) if len(sessions) else 0
+    if last_day is None:
+        last_day = int(sessions.day[-1]) if len(sessions) else first_day
+    day_count = last_day - first_day + 1
+
+    with stage('heatmap', rows=len(sessions)):
+        raster = heatmap_array(sessions, first_day, last_day, bin_minutes)
+        fig, ax = plt.subplots(figsize=(12, 8))
+        image = draw_heatmap(ax, raster, day_count, bin_minutes)
+        ax.set_xticks(range(0, MINUTES_PER_DAY + 1, 120))
+        ax.set_xticklabels([f"{h:02d}:00" for h in range(0, 25, 2)])
+        ticks = np.linspace(0, day_count - 1, min(day_count, 12)).astype(int)
+        ax.set_yticks(ticks)
+        ax.set_yticklabels(np.datetime_as_string(
+            (first_day + ticks).astype('datetime64[D]')))
+        dates = np.datetime_as_string(
+            np.array([first_day, last_day], dtype='datetime64[D]'))
+        ax.set_title(f"Sleep Heatmap ({dates[0]} to {dates[1]})")
+        ax.set_xlabel('Time of Day')
+        ax.set_ylabel('Date')
+        fig.colorbar(image, ax=ax,
+                     label=f'Minutes asleep (per {bin_minutes} min)')
+        fig.tight_layout()
+    return fig
+
+
+def main(argv=None):
+    """ python heatmap.py [--days N] [--start DATE] [--end DATE] """
+    parser = argparse.ArgumentParser(
+        description="Heatmap of the whole sleep journal.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--start', help="first day to show, YYYY-MM-DD")
+    parser.add_argument('--end', help="last day to show, YYYY-MM-DD")
+    parser.add_argument('--days', type=int, help="number of days to show")
+    parser.add_argument('--bin', type=int, default=BIN_MINUTES,
+                        help="minutes per pixel column (default: "
+                             "%(default)s)")
+    parser.add_argument('--output',
+                        help="save the image to this file instead of "
+                             "showing it")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+
+    if args.output:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    sessions = SessionArray.from_frame(load_sessions(args.csv))
+    fig = plot_heatmap(sessions, args.start, args.end, args.days, args.bin)
+    if args.output:
+        fig.savefig(args.output)
+    else:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+from parsers import DATE_PATTERN, HHMM_PATTERN
+
+"""
+    Quick commands on the journal, for a shell prompt or a cron job:
+        python journal_cli.py tail [-n 5] [--check]
+        python journal_cli.py validate [journal.csv]
+        python journal_cli.py stats-text
+    tail and validate only use the standard library (and the patterns of
+    parsers.py), so they answer in a few tens of milliseconds.
+    stats-text needs numpy and pandas for the stats, but not matplotlib.
+"""
+script_dir = Path(__file__).parent
+raw_path = script_dir.parent / "assets" / "sleep_journal.csv"
+cleaned_path = script_dir.parent / "assets" / "sleep_journal_cleaned.csv"
+
+TAIL_BLOCK = 4096
+
+
+def last_lines(path, count):
+    """ The last count lines of a file, read backwards from its end """
+    with open(path, 'rb') as f:
+        f.seek(0, 2)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode().splitlines()
+    # The first line may be cut in half, unless the whole file was read
+    if position > 0:
+        lines = lines[1:]
+    return [line for line in lines if line.strip()][-count:]
+
+
+def tail(path=cleaned_path, count=5, today=None):
+    """ Returns (last lines, last logged date, days since it) """
+    today = today or date.today()
+    lines = last_lines(path, count)
+    last_date = None
+    for line in reversed(lines):
+        cell = line.split(',', 1)[0]
+        try:
+            last_date = datetime.strptime(cell, '%d/%m/%Y').date()
+            break
+        except ValueError:  # Header, or a raw DD/MM date
+            pass
+        match = DATE_PATTERN.match(cell)
+        if match and not match['year']:
+            # A raw journal: the latest year that isn't in the future
+            day, month = int(match['day']), int(match['month'])
+            for year in (today.year, today.year - 1):
+                try:
+                    candidate = date(year, month, day)
+                except ValueError:
+                    continue
+                if candidate <= today:
+                    last_date = candidate
+                    break
+            if last_date is not None:
+                break
+    days = (today - last_date).days if last_date else None
+    return lines, last_date, days
+
+
+def _valid_hhmm(cell):
+    match = HHMM_PATTERN.match(cell)
+    return bool(match) and int(match['hours']) < 24 \
+        and int(match['minutes']) < 60
+
+
+def validate(path=raw_path):
+    """ [(line number, column, cell)] of the cells that won't parse.
+        Blank dates (more sleep on the same day), NUIT BLANCHE and
+        ,,,00:00 lines are fine.
+    """
+    problems = []
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        for number, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) != len(header):
+                problems.append((number, 'line', ",".join(row)))
+                continue
+            cells = dict(zip(header, row))
+            day = cells['Date'].strip()
+            if day == 'NUIT BLANCHE' or not (cells['Onset'].strip()
+                                             or cells['Wakeup'].strip()):
+                continue
+            if day and not DATE_PATTERN.match(day):
+                problems.append((number, 'Date', day))
+            for column in ('Onset', 'Wakeup', 'Duration'):
+                if not _valid_hhmm(cells[column]):
+                    problems.append((number, column, cells[column]))
+    return problems
+
+
+def stats_text(csv_path=cleaned_path):
+    # Imported here: numpy is slow to import. pandas is only imported when
+    # the .npy cache of the sessions has to be rebuilt.
+    from sleep_stats import SleepDataset, format_stats
+    return format_stats(SleepDataset.load_light(csv_path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Quick looks at the sleep journal.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    tail_parser = commands.add_parser(
+        'tail', help="last entries, and days since the last one")
+    tail_parser.add_argument('csv', nargs='?', default=cleaned_path,
+                             help="journal (default: %(default)s)")
+    tail_parser.add_argument('-n', type=int, default=5,
+                             help="lines to show (default: %(default)s)")
+    tail_parser.add_argument('--check', action='store_true',
+                             help="exit with 1 when nothing was logged "
+                                  "since yesterday")
+
+    validate_parser = commands.add_parser(
+        'validate', help="list the cells the cleaner can't parse")
+    validate_parser.add_argument('csv', nargs='?', default=raw_path,
+                                 help="raw journal (default: %(default)s)")
+
+    stats_parser = commands.add_parser(
+        'stats-text', help="print the statistics, without plots")
+    stats_parser.add_argument('csv', nargs='?', default=cleaned_path,
+                              help="cleaned journal (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'tail':
+        lines, last_date, days = tail(args.csv, args.n)
+        print("\n".join(lines))
+        if last_date is None:
+            print("No dated entry found")
+            sys.exit(1)
+        print(f"Last entry: {last_date:%d/%m/%Y} ({days} days ago)")
+        if args.check and days > 1:
+            sys.exit(1)
+    elif args.command == 'validate':
+        problems = validate(args.csv)
+        for number, column, cell in problems:
+            print(f"line {number}: bad {column} {cell!r}")
+        print(f"{len(problems)} problems in {args.csv}")
+        if problems:
+            sys.exit(1)
+    else:
+        print(stats_text(args.csv))
+
+
+if __name__ == "__main__":
+    main()
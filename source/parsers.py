@@ -0,0 +1,197 @@
+import re
+
+"""
+    Column-at-a-time parsers for the journal's cells.
+    Instead of one Python call (and a few re.match) per cell, each parser
+    looks at the whole column as a (rows, characters) array of code points
+    (straight from the bytes of the joined cells when they all have the
+    same length, which is the usual case):
+    the usual zero-padded shapes (07:30, 05/03, 05//03, 05/03/24,
+    05/03/2024) are checked and turned into numbers with integer maths
+    on that array.
+    Only the cells left over (unpadded, stray spaces, typos) go through
+    one str.extract with the patterns below.
+    Cells that don't parse become NaT/NaN, and come back as a boolean mask
+    instead of being printed one at a time.
+    numpy and pandas are imported inside the parsers, so the patterns can
+    be used (journal_cli validate) without loading them.
+"""
+# DD/MM, DD//MM (a typo that happens), DD/MM/YY and DD/MM/YYYY
+DATE_PATTERN = re.compile(
+    r'^\s*(?P<day>\d{1,2})//?(?P<month>\d{1,2})'
+    r'(?:/(?P<year>\d{4}|\d{2}))?\s*$')
+# HH:MM, for times of day and durations alike
+HHMM_PATTERN = re.compile(r'^\s*(?P<hours>\d{1,2}):(?P<minutes>\d{2})\s*$')
+
+SLASH, COLON = ord('/'), ord(':')
+# Days in each month of a common year
+MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def _fixed_width(column, width):
+    """ The fast way in for the usual column, ASCII cells all of the same
+        length: they are joined into one string (a single C loop), whose
+        bytes are the (rows, length + 1) array, newlines last.
+        Returns chars like _characters, or None for any other column
+        (empty cells are NaN and make the join fail).
+    """
+    import numpy as np
+    cells = np.asarray(column.array)  # No copy for str/object columns
+    count = len(cells)
+    try:
+        joined = "\n".join(cells) + "\n"
+    except TypeError:
+        return None
+    length = len(joined) // max(count, 1) - 1
+    if (not count or len(joined) != count * (length + 1) or length > width
+            or not joined.isascii() or joined.count("\n") != count):
+        return None
+    rows = np.frombuffer(joined.encode('ascii'), dtype='u1').reshape(
+        count, length + 1)
+    if (rows[:, length] != ord("\n")).any():
+        return None
+    chars = np.zeros((count, width + 1), dtype='i2')  # ASCII is enough
+    chars[:, :length] = rows[:, :length]
+    return chars
+
+
+def _characters(column, width):
+    """ Returns (chars, filled):
+            chars   (rows, width + 1) integer array of code points, 0 after
+                    the end; a non-zero last column means the cell is
+                    longer than width
+            filled  where the cell isn't empty
+        Empty cells come out of to_numpy as 'nan' (cheaper to spot here
+        than with notna; read_csv turns a 'nan' cell into NaN anyway).
+    """
+    import numpy as np
+    chars = _fixed_width(column, width)
+    if chars is not None:
+        return chars, np.ones(len(chars), dtype=bool)
+    text = column.to_numpy(dtype=f'U{width + 1}')
+    chars = text.view('<u4').reshape(len(text), width + 1).astype('i4')
+    empty = ((chars[:, 0] == ord('n')) & (chars[:, 1] == ord('a'))
+             & (chars[:, 2] == ord('n')) & (chars[:, 3] == 0))
+    return chars, ~empty
+
+
+def _digits(chars):
+    """ Values of the characters, and where they are digits """
+    values = chars - ord('0')
+    return values, (values >= 0) & (values <= 9)
+
+
+def _epoch_days(year, month, day):
+    """ Days since 1970-01-01 of valid (year, month, day) int64 arrays,
+        counting years from March so the leap day comes last
+    """
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = (year_of_era * 365 + year_of_era // 4
+                  - year_of_era // 100 + day_of_year)
+    return era * 146097 + day_of_era - 719468
+
+
+def parse_dates(column, default_year=None):
+    """ Returns (dates, bad) for a column of date strings:
+            dates  datetime64 Series, NaT where a cell didn't parse
+            bad    boolean Series, True for cells that were filled in
+                   but didn't parse (empty cells are not bad)
+        DD/MM cells take default_year (NaT if there is none),
+        DD/MM/YY ones are taken as 20YY.
+    """
+    import numpy as np
+    import pandas as pd
+    chars, filled = _characters(column, 10)
+    value, digit = _digits(chars)
+    ddmm = (digit[:, 0] & digit[:, 1] & (chars[:, 2] == SLASH)
+            & digit[:, 3] & digit[:, 4])
+    short = ddmm & (chars[:, 5] == 0)
+    double_slash = (digit[:, 0] & digit[:, 1] & (chars[:, 2] == SLASH)
+                    & (chars[:, 3] == SLASH) & digit[:, 4] & digit[:, 5]
+                    & (chars[:, 6] == 0))
+    with_year = ddmm & (chars[:, 5] == SLASH) & digit[:, 6] & digit[:, 7]
+    yy = with_year & (chars[:, 8] == 0)
+    yyyy = with_year & digit[:, 8] & digit[:, 9] & (chars[:, 10] == 0)
+
+    day = (value[:, 0] * 10 + value[:, 1]).astype(float)
+    month = np.where(double_slash, value[:, 4] * 10 + value[:, 5],
+                     value[:, 3] * 10 + value[:, 4]).astype(float)
+    year = np.select(
+        [yyyy, yy],
+        [value[:, 6] * 1000 + value[:, 7] * 100 + value[:, 8] * 10
+         + value[:, 9], 2000 + value[:, 6] * 10 + value[:, 7]],
+        default=np.nan)
+
+    # The odd ones out go through the regex
+    fast = short | double_slash | yy | yyyy
+    rest = ~fast & filled
+    if rest.any():
+        parts = column[rest].str.extract(DATE_PATTERN)
+        day[rest] = pd.to_numeric(parts['day'])
+        month[rest] = pd.to_numeric(parts['month'])
+        year_rest = pd.to_numeric(parts['year']).to_numpy(dtype=float)
+        year[rest] = np.where(year_rest < 100, year_rest + 2000, year_rest)
+    day[~(fast | rest)] = np.nan
+    if default_year is not None:
+        year = np.where(np.isnan(year) & ~np.isnan(day), default_year, year)
+
+    # Out of range days (31/02, 29/02/2023) are dropped with the month
+    # lengths, then the dates are counted with integer maths (numpy's
+    # month to day conversions are a good part of the time otherwise)
+    valid = ((month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+             & ~np.isnan(year))
+    y = np.where(valid, year, 1970).astype('i8')
+    m = np.where(valid, month, 1).astype('i8')
+    d = np.where(valid, day, 1).astype('i8')
+    leap = (y % 4 == 0) & ((y % 100 != 0) | (y % 400 == 0))
+    valid &= d <= np.array(MONTH_DAYS)[m - 1] + (leap & (m == 2))
+    dates = (_epoch_days(y, m, d) * 86400).view('M8[s]')
+    dates[~valid] = np.datetime64('NaT')
+    bad = pd.Series(~valid & filled, index=column.index)
+    # In seconds, as pandas would store them (it converts days slowly)
+    return pd.Series(dates, index=column.index, name=column.name), bad
+
+
+def parse_hhmm(column):
+    """ Returns (minutes, bad) for a column of HH:MM strings:
+            minutes  float Series, NaN where a cell didn't parse
+            bad      boolean Series, True for filled in cells that
+                     didn't parse or are out of range (25:00, 10:75)
+    """
+    import numpy as np
+    import pandas as pd
+    chars, filled = _characters(column, 5)
+    value, digit = _digits(chars)
+    padded = (digit[:, 0] & digit[:, 1] & (chars[:, 2] == COLON)
+              & digit[:, 3] & digit[:, 4] & (chars[:, 5] == 0))
+    hours = (value[:, 0] * 10 + value[:, 1]).astype(float)
+    minutes = (value[:, 3] * 10 + value[:, 4]).astype(float)
+    hours[~padded] = np.nan
+
+    # The odd ones out go through the regex
+    rest = ~padded & filled
+    if rest.any():
+        parts = column[rest].str.extract(HHMM_PATTERN)
+        hours[rest] = pd.to_numeric(parts['hours'])
+        minutes[rest] = pd.to_numeric(parts['minutes'])
+
+    valid = (hours < 24) & (minutes < 60)
+    total = np.where(valid, hours * 60 + minutes, np.nan)
+    bad = pd.Series(~valid & filled, index=column.index)
+    return pd.Series(total, index=column.index, name=column.name), bad
+
+
+def minutes_or_raise(column, dtype='int16'):
+    """ parse_hhmm for columns that must be complete: raises ValueError
+        naming the bad rows, otherwise returns integer minutes
+    """
+    import numpy as np
+    total, bad = parse_hhmm(column)
+    bad |= total.isna()
+    if bad.any():
+        raise ValueError(f"Not HH:MM in '{column.name}', rows "
+                         f"{list(column.index[np.asarray(bad)])}")
+    return total.astype(dtype)
@@ -0,0 +1,146 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Headless: no window is ever opened
+import matplotlib.pyplot as plt
+
+from render_cache import RenderCache, cache_dir, render_window
+from session_store import file_path, list_users, load_sessions, open_arrays
+from sessions import SessionArray
+
+"""
+    Renders many plots into a directory without showing anything,
+    one file per week, per month, or for the whole history,
+    for the journal or for every user of an array store.
+    Figures are spread over a process pool: each worker has its own
+    matplotlib state and gets the sessions once, when it starts. With an
+    array store, each worker memory-maps it itself, so the sessions are
+    never copied, not even to send them over.
+    Renders go through the render cache, so only the periods whose
+    sessions (or colour thresholds) changed are drawn again.
+"""
+PERIODS = ('week', 'month', 'all')
+
+# Set in each worker by _init_worker: {user: SessionArray}
+_worker_sessions = {}
+_worker_cache = None
+
+
+def period_windows(sessions, period):
+    """ (name, first_day, last_day) of every period the sessions touch.
+        Weeks go Monday to Sunday.
+    """
+    if len(sessions) == 0:
+        return []
+    first, last = int(sessions.day[0]), int(sessions.day[-1])
+    if period == 'all':
+        return [('all', first, last)]
+    if period == 'week':
+        # Day 0 (1970-01-01) was a Thursday
+        monday = first - (first + 3) % 7
+        starts = np.arange(monday, last + 1, 7)
+        return [(f"week-{np.datetime64(int(s), 'D')}", int(s), int(s) + 6)
+                for s in starts]
+    if period == 'month':
+        months = np.arange(np.datetime64(first, 'D').astype('datetime64[M]'),
+                           np.datetime64(last, 'D').astype('datetime64[M]')
+                           + 1)
+        starts = months.astype('datetime64[D]').astype(int)
+        ends = (months + 1).astype('datetime64[D]').astype(int) - 1
+        return [(f"month-{m}", int(s), int(e))
+                for m, s, e in zip(months, starts, ends)]
+    raise ValueError(f"period must be one of {PERIODS}, not {period!r}")
+
+
+def _init_worker(records_by_user, cache_directory, store_dir):
+    global _worker_cache
+    plt.switch_backend('Agg')
+    for user, records in records_by_user.items():
+        if store_dir is not None:
+            records = open_arrays(store_dir, user)
+        _worker_sessions[user] = SessionArray(records)
+    if cache_directory is not None:
+        _worker_cache = RenderCache(cache_directory)
+
+
+def _render(job):
+    user, name, first, last, out_dir, formats = job
+    rendered = render_window(_worker_sessions[user],
+                             np.datetime64(first, 'D'),
+                             np.datetime64(last, 'D'),
+                             formats=formats, cache=_worker_cache)
+    paths = []
+    for fmt, data in rendered.items():
+        path = Path(out_dir) / f"{name}.{fmt}"
+        path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+def export_plots(sessions_by_user, out_dir, period='week', formats=('png',),
+                 workers=None, cache_directory=cache_dir, store_dir=None):
+    """ Writes one figure per period and format into out_dir
+        (out_dir/<user>/ when there are several users).
+        sessions_by_user is {user: SessionArray}. Returns the paths.
+        cache_directory=None renders everything without the cache.
+        store_dir is the array store the sessions were opened from, if
+        any: the workers then open it too instead of getting copies.
+    """
+    out_dir = Path(out_dir)
+    jobs = []
+    for user, sessions in sessions_by_user.items():
+        user_dir = out_dir / user if len(sessions_by_user) > 1 else out_dir
+        user_dir.mkdir(parents=True, exist_ok=True)
+        for name, first, last in period_windows(sessions, period):
+            jobs.append((user, name, first, last, user_dir, tuple(formats)))
+
+    records = {user: None if store_dir is not None else sessions.records
+               for user, sessions in sessions_by_user.items()}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(records, cache_directory,
+                                       store_dir)) as pool:
+        # A few jobs per task so short renders don't wait on the pipe
+        chunksize = max(1, len(jobs) // (4 * (workers or os.cpu_count())))
+        done = pool.map(_render, jobs, chunksize=chunksize)
+        return [path for paths in done for path in paths]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export sleep plots to files, using every core.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--period', choices=PERIODS, default='week')
+    parser.add_argument('--format', nargs='+', default=['png'],
+                        choices=['png', 'svg', 'pdf'], dest='formats')
+    parser.add_argument('--workers', type=int,
+                        help="processes to use (default: all cores)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    source.add_argument('--store',
+                        help="directory of session arrays, one plot "
+                             "set per user")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="draw every plot, ignoring the render cache")
+    args = parser.parse_args(argv)
+
+    if args.store:
+        sessions_by_user = {
+            user: SessionArray(open_arrays(args.store, user))
+            for user in list_users(args.store)}
+    else:
+        sessions_by_user = {
+            'journal': SessionArray.from_frame(load_sessions(args.csv))}
+
+    paths = export_plots(sessions_by_user, args.out_dir, args.period,
+                         args.formats, args.workers,
+                         None if args.no_cache else cache_dir, args.store)
+    print(f"Wrote {len(paths)} files into {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
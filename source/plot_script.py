@@ -1,29 +1,258 @@
+import argparse
 from pathlib import Path
-from datetime import datetime, timedelta
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 
+from profiling import add_arguments, enable_from_args, stage
+from session_store import load_sessions
+from sessions import SessionArray, MINUTES_PER_DAY
+
+
+# matplotlib is only imported by the functions that draw, so importing
+# this module (or running --help) doesn't pay for it.
 
 # Find sleep_journal file
 script_dir = Path(__file__).parent
-file_path = script_dir.parent / "assets" / "sleep_journal_13.04.2025_cleaned.csv"
-df = pd.read_csv(file_path,
-                 # parse_dates=["Date"],
-                 # date_parser=date_parser
-                 # date_format="%d/%m/%Y"
-                 )
-
-df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y", errors='coerce')
-
-# Hunting for erroneous date entries
-invalid_dates = df[df['Date'].isna()]
-if not invalid_dates.empty:
-    print("Found invalid dates in these rows:")
-    for idx, row in invalid_dates.iterrows():
-        print(f"Row {idx}: Original value was '{row['Date']}'")
-
-# print(df.head())
-# print(df.tail())
-# print(df['Date'].dtype)
+file_path = script_dir.parent / "assets" / "sleep_journal_cleaned.csv"
+
+# Bump this when the look of the plots changes: cached renders are
+# keyed on it (see render_cache.py)
+PLOT_STYLE_VERSION = 2
+BAR_HEIGHT = 0.7
+LABEL_FONTSIZE = 8
+# Face colour of each session kind, in SESSION_KINDS order
+KIND_COLORS = np.array(['blue', 'orange', 'yellow', 'gray'])
+KIND_LABELS = ('Night Sleep', 'Day Sleep', 'Nap', 'Fragmented')
+
+
+def find_invalid_dates(df):
+    """ Returns the rows of a loaded journal whose 'Date' didn't parse """
+    return df[df['Date'].isna()]
+
+
+# Edge colour of each duration_edge_codes() code
+EDGE_COLORS = np.array(['green', 'red', 'purple'])
+
+
+def duration_edge_codes(duration, avg_duration, std_deviation):
+    """ Edge class per session (int8, EDGE_COLORS index):
+        1 (red) for too little sleep (< avg - 1 std),
+        2 (purple) for too much (> avg + 1 std), 0 (green) otherwise
+    """
+    return np.select([duration < avg_duration - std_deviation,
+                      duration > avg_duration + std_deviation],
+                     [1, 2], default=0).astype('i1')
+
+
+def duration_edge_colors(duration, avg_duration, std_deviation):
+    """ Edge colour per session, see duration_edge_codes """
+    return EDGE_COLORS[duration_edge_codes(duration, avg_duration,
+                                           std_deviation)]
+
+
+def threshold_text(avg_duration, std_deviation):
+    """ The average and std lines of the plot's stats text """
+    return (f"Average Sleep: {avg_duration // 60:.0f}h "
+            f"{avg_duration % 60:.0f}m\n"
+            f"Standard Deviation: {std_deviation // 60:.0f}h "
+            f"{std_deviation % 60:.0f}m")
+
+
+def bar_vertices(left, width, y, height=BAR_HEIGHT):
+    """ (n, 4, 2) array of rectangle corners, for a PolyCollection """
+    left = np.asarray(left, dtype=float)
+    right = left + width
+    bottom = np.asarray(y, dtype=float) - height / 2
+    top = bottom + height
+    return np.stack([np.column_stack([left, bottom]),
+                     np.column_stack([left, top]),
+                     np.column_stack([right, top]),
+                     np.column_stack([right, bottom])], axis=1)
+
+
+def draw_sessions(ax, sessions, first_day, avg_duration, std_deviation,
+                  kind_codes=None, minutes_shown=MINUTES_PER_DAY):
+    """ Draws every session as one PolyCollection, then its labels.
+        Sessions past midnight are split first, the rest of the night
+        going at the start of the next day's row. Segments before
+        first_day's row are left out, so the sessions of the day before
+        can be passed for what they spill into it.
+        Faces follow the session kinds (KIND_COLORS, classify() codes,
+        computed here when not given); edges follow duration_edge_colors.
+        Both parts of a split session share its colours and only the
+        wider part gets the label.
+        Returns the collection and the label texts.
+    """
+    from matplotlib.collections import PolyCollection
+    if kind_codes is None:
+        kind_codes = sessions.kind_codes
+    segments = sessions.split_at_midnight()
+    shown = segments['day'] >= first_day
+    segments = {name: part[shown] for name, part in segments.items()}
+    parent = segments['index']
+    y = segments['day'] - first_day
+    faces = KIND_COLORS[kind_codes][parent]
+    edges = duration_edge_colors(sessions.duration, avg_duration,
+                                 std_deviation)[parent]
+    bars = PolyCollection(bar_vertices(segments['left'], segments['width'],
+                                       y),
+                          facecolors=faces, edgecolors=edges,
+                          linewidths=2, alpha=0.7)
+    ax.add_collection(bars)
+    main = segments['main']
+    labels = draw_duration_labels(ax, segments['left'][main],
+                                  segments['width'][main], y[main],
+                                  sessions.duration[parent[main]],
+                                  minutes_shown)
+    return bars, labels
+
+
+def draw_duration_labels(ax, left, width, y, duration,
+                         minutes_shown=MINUTES_PER_DAY):
+    """ Writes "XhYYm" (the session's duration) in the bars wide enough
+        to hold it, when the axes' width shows minutes_shown minutes.
+        The culling is done on the whole arrays first, so text artists
+        are only made for the labels that fit. Returns them.
+    """
+    fig = ax.get_figure()
+    ax_width_px = (fig.get_size_inches()[0] * fig.dpi
+                   * ax.get_position().width)
+    bar_px = np.asarray(width) / minutes_shown * ax_width_px
+    # "7h05m" is 5 characters, about 0.6 em each
+    label_px = 5 * 0.6 * LABEL_FONTSIZE * fig.dpi / 72
+    fits = bar_px > label_px
+    hours, minutes = np.divmod(np.asarray(duration)[fits], 60)
+    centers = (np.asarray(left) + np.asarray(width) / 2)[fits]
+    return [ax.text(x, row, f"{h}h{m:02d}m", va='center', ha='center',
+                    color='black', fontweight='bold',
+                    fontsize=LABEL_FONTSIZE, clip_on=True)
+            for x, row, h, m in zip(centers, np.asarray(y)[fits], hours,
+                                    minutes)]
+
+
+def plot_window(sessions, start=None, end=None, days=None,
+                thresholds=None):
+    """ Plots one window of the sessions, one row per calendar day.
+        The window is picked like SessionArray.window: the last `days`
+        days, `days` from/up to a date, or from start to end.
+        Colour thresholds still come from the whole history; pass them
+        as (mean, std) when they are already known.
+        Returns the figure.
+    """
+    if thresholds is None:
+        thresholds = (sessions.duration.mean(),
+                      sessions.duration.std(ddof=1))
+    avg_duration, std_deviation = thresholds
+
+    first_day, last_day = sessions.window_bounds(start, end, days)
+    # With the day before, for the after-midnight part of its sessions
+    window = sessions.window(start, end, days, eve=True)
+    kind_codes = sessions.window_kind_codes(start, end, days, eve=True)
+    if first_day is None:  # No day before then
+        first_day = int(window.day.min()) if len(window) else 0
+    if last_day is None:
+        last_day = int(window.day.max()) if len(window) else first_day
+    # + 1 for the morning after the last night
+    day_count = last_day - first_day + 1
+    day_count += bool(window[window.day == last_day].ends_past_midnight
+                      .any())
+
+    with stage('render', rows=len(window)):
+        fig = _draw_window(window, first_day, last_day, day_count,
+                           avg_duration, std_deviation, kind_codes)
+    return fig
+
+
+def _draw_window(window, first_day, last_day, day_count, avg_duration,
+                 std_deviation, kind_codes):
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Patch
+    fig, ax = plt.subplots(figsize=(12, max(8, day_count * 0.2)))
+    draw_sessions(ax, window, first_day, avg_duration, std_deviation,
+                  kind_codes)
+
+    # Format the y-axis with dates, thinned out for long windows
+    step = max(1, day_count // 60)
+    ticks = np.arange(0, day_count, step)
+    ax.set_yticks(ticks)
+    ax.set_yticklabels(np.datetime_as_string(
+        (first_day + ticks).astype('datetime64[D]')))
+    ax.set_ylim(-1, day_count)
+
+    # Format the x-axis as hours
+    ax.set_xticks(range(0, MINUTES_PER_DAY, 60))
+    ax.set_xticklabels([f"{h:02d}:00" for h in range(24)])
+    ax.set_xlim(0, MINUTES_PER_DAY)
+
+    # Add grid, title and labels
+    ax.grid(axis='x', linestyle='--', alpha=0.7)
+    dates = np.datetime_as_string(
+        np.array([first_day, last_day], dtype='datetime64[D]'))
+    ax.set_title(f"Sleep Patterns ({dates[0]} to {dates[1]})")
+    ax.set_xlabel('Time of Day')
+    ax.set_ylabel('Date')
+
+    # Add legend
+    legend_elements = [
+        Patch(facecolor=color, alpha=0.7, label=label)
+        for color, label in zip(KIND_COLORS, KIND_LABELS)
+    ] + [
+        Patch(facecolor='gray', edgecolor='red', linewidth=2,
+              label='Too Little Sleep'),
+        Patch(facecolor='gray', edgecolor='purple', linewidth=2,
+              label='Too Much Sleep'),
+        Patch(facecolor='gray', edgecolor='green', linewidth=2,
+              label='Normal Sleep'),
+    ]
+    ax.legend(handles=legend_elements, loc='upper center',
+              bbox_to_anchor=(0.5, -0.05), ncol=4)
+
+    # Show statistics
+    stats_text = (
+        threshold_text(avg_duration, std_deviation) + "\n"
+        f"Number of Sessions: {np.count_nonzero(window.day >= first_day)}"
+    )
+    fig.text(0.02, 0.02, stats_text, fontsize=10)
+    fig.tight_layout()
+    return fig
+
+
+def visualize_sleep(sessions, days_to_show=30):
+    """ Plots the last days_to_show days (everything if it's 0) """
+    return plot_window(sessions, days=days_to_show if days_to_show > 0
+                       else None)
+
+
+def main(argv=None):
+    """ python plot_script.py [--days N] [--start DATE] [--end DATE] """
+    parser = argparse.ArgumentParser(description="Plot the sleep journal.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--start', help="first day to show, YYYY-MM-DD")
+    parser.add_argument('--end', help="last day to show, YYYY-MM-DD")
+    parser.add_argument('--days', type=int,
+                        help="number of days to show (default: 30 when "
+                             "start and end aren't both given)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+    if args.days is None and (args.start is None or args.end is None):
+        args.days = 30
+
+    df = load_sessions(args.csv)
+
+    # Hunting for erroneous date entries
+    invalid_dates = find_invalid_dates(df)
+    if not invalid_dates.empty:
+        print("Found invalid dates in these rows:")
+        for idx, row in invalid_dates.iterrows():
+            print(f"Row {idx}: {row['Onset']} -> {row['Wakeup']}")
+
+    plot_window(SessionArray.from_frame(df), args.start, args.end,
+                args.days)
+    import matplotlib.pyplot as plt
+    plt.show()
+    return df
+
+
+if __name__ == "__main__":
+    main()
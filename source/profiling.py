@@ -0,0 +1,142 @@
+import atexit
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource  # Not on Windows
+except ImportError:
+    resource = None
+
+"""
+    Opt-in timing of the pipeline's stages (read_csv, year unrolling,
+    parsing, aggregates, rendering...).
+    Turn it on with SLEEP_PROFILE=<report.json> in the environment (or
+    SLEEP_PROFILE=1 for profile.json), or with --profile on the scripts.
+    Each stage records its wall time, rows, rows/s and the peak RSS so far;
+    at exit the summary is written as JSON and printed as a table.
+    SLEEP_PROFILE_CPROFILE=1 (or --cprofile) also runs every outermost
+    stage under cProfile (stages nested in it show up in its profile, and
+    only one profiler can be on at a time) and dumps the slowest one next
+    to the report.
+    When it's off, stage() costs one function call.
+"""
+ENV_VAR = 'SLEEP_PROFILE'
+CPROFILE_ENV_VAR = 'SLEEP_PROFILE_CPROFILE'
+
+_settings = {'output': None, 'cprofile': False, 'depth': 0}
+_records = []
+_profiles = []
+
+
+def enabled():
+    return _settings['output'] is not None
+
+
+def enable(output='profile.json', cprofile=False):
+    """ Starts recording stages; the summary is written at exit """
+    if not enabled():
+        atexit.register(write_summary)
+    _settings['output'] = Path(output)
+    _settings['cprofile'] = cprofile
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@contextmanager
+def stage(name, rows=None):
+    """ Times the block as one stage. The block can set the row count
+        afterwards, when it's only known at the end:
+            with stage('read_csv') as record:
+                df = pd.read_csv(path)
+                record['rows'] = len(df)
+    """
+    record = {'stage': name, 'rows': rows}
+    if not enabled():
+        yield record
+        return
+    outermost = _settings['depth'] == 0
+    profile = (cProfile.Profile() if _settings['cprofile'] and outermost
+               else None)
+    start = time.perf_counter()
+    if profile is not None:
+        profile.enable()
+    _settings['depth'] += 1
+    try:
+        yield record
+    finally:
+        _settings['depth'] -= 1
+        if profile is not None:
+            profile.disable()
+        seconds = time.perf_counter() - start
+        rows = record['rows']
+        record.update({
+            'seconds': seconds,
+            'rows_per_s': rows / seconds if rows and seconds else None,
+            'peak_rss_bytes': _peak_rss_bytes(),
+        })
+        _records.append(record)
+        if profile is not None:
+            _profiles.append((seconds, name, profile))
+
+
+def format_table(records):
+    lines = [f"{'stage':<22} {'seconds':>9} {'rows':>10} {'rows/s':>12} "
+             f"{'peak RSS MB':>12}"]
+    for record in records:
+        rss = record['peak_rss_bytes']
+        lines.append(
+            f"{record['stage']:<22} {record['seconds']:>9.4f} "
+            f"{record['rows'] if record['rows'] is not None else '':>10} "
+            f"{record['rows_per_s'] or 0:>12.0f} "
+            f"{rss / 2**20 if rss else 0:>12.1f}")
+    return "\n".join(lines)
+
+
+def write_summary():
+    """ Writes the JSON report, the cProfile dump, and prints the table """
+    if not enabled() or not _records:
+        return
+    output = _settings['output']
+    summary = {'argv': sys.argv, 'stages': _records}
+    if _profiles:
+        seconds, name, profile = max(_profiles, key=lambda item: item[0])
+        dump = output.with_suffix(f".{name}.prof")
+        profile.dump_stats(dump)
+        summary['cprofile'] = {'stage': name, 'path': str(dump)}
+    output.write_text(json.dumps(summary, indent=2))
+    print(format_table(_records), file=sys.stderr)
+    print(f"Profile written to {output}", file=sys.stderr)
+
+
+def add_arguments(parser):
+    """ Adds --profile and --cprofile to a script's argument parser """
+    parser.add_argument('--profile', nargs='?', const='profile.json',
+                        metavar='REPORT',
+                        help="time each stage, report to REPORT "
+                             "(default: profile.json)")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="with --profile, dump cProfile stats of the "
+                             "slowest stage")
+
+
+def enable_from_args(args):
+    if args.profile:
+        enable(args.profile, args.cprofile)
+
+
+# The environment variable works for any entry point, even imported ones
+if os.environ.get(ENV_VAR):
+    value = os.environ[ENV_VAR]
+    enable('profile.json' if value == '1' else value,
+           bool(os.environ.get(CPROFILE_ENV_VAR)))
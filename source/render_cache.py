@@ -0,0 +1,136 @@
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+
+from plot_script import PLOT_STYLE_VERSION, duration_edge_codes, \
+    plot_window, threshold_text
+
+"""
+    On-disk cache of rendered plots, so an unchanged window isn't drawn
+    again. The key is a hash of what the picture depends on:
+        the window's sessions and their kinds (which depend on
+        the sessions just outside the window too),
+        the window bounds,
+        the colour thresholds as the figure shows them: each session's
+        edge class, and the mean and std as printed (to the minute),
+        rather than the exact whole-history floats, which every new
+        session changes,
+        PLOT_STYLE_VERSION, bumped whenever the look of the plots changes.
+    Files are named after their key and format. Reading one refreshes its
+    mtime, and the least recently used files go first when the cache is
+    too big.
+"""
+script_dir = Path(__file__).parent
+cache_dir = script_dir.parent / "assets" / "render_cache"
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def write_atomic(path, data):
+    """ Writes bytes aside then renames them into place, so readers (the
+        cache, image viewers) never see half a file
+    """
+    path = Path(path)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def render_key(sessions, codes, params):
+    """ Hex digest of the session records, per session code arrays (kinds,
+        edge classes) and the plot parameters
+    """
+    digest = hashlib.sha256(sessions.records.tobytes())
+    for array in codes:
+        digest.update(array.tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(str(PLOT_STYLE_VERSION).encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+
+    def __init__(self, directory=cache_dir, max_bytes=MAX_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key, fmt):
+        return self.directory / f"{key}.{fmt}"
+
+    def get(self, key, fmt):
+        """ Cached bytes, or None on a miss """
+        path = self._path(key, fmt)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # Recently used
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, fmt, data):
+        write_atomic(self._path(key, fmt), data)
+        self.evict()
+
+    def evict(self):
+        """ Removes least recently used files until under max_bytes """
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == '.tmp':  # Still being written
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def window_key(sessions, start=None, end=None, days=None):
+    """ render_key of plot_window(sessions, start, end, days) """
+    first_day, last_day = sessions.window_bounds(start, end, days)
+    # What plot_window draws, the day before's sessions included
+    window = sessions.window(start, end, days, eve=True)
+    avg = float(sessions.duration.mean())
+    std = float(sessions.duration.std(ddof=1))
+    codes = (sessions.window_kind_codes(start, end, days, eve=True),
+             duration_edge_codes(window.duration, avg, std))
+    params = {'first_day': first_day, 'last_day': last_day,
+              'thresholds': threshold_text(avg, std)}
+    return render_key(window, codes, params)
+
+
+def render_window(sessions, start=None, end=None, days=None,
+                  formats=('png',), cache=None):
+    """ {format: bytes} of plot_window(sessions, start, end, days),
+        taken from the cache when nothing the plot depends on changed.
+        The figure is only drawn if a format is missing.
+    """
+    key = window_key(sessions, start, end, days)
+    rendered = {}
+    if cache is not None:
+        for fmt in formats:
+            data = cache.get(key, fmt)
+            if data is not None:
+                rendered[fmt] = data
+    missing = [fmt for fmt in formats if fmt not in rendered]
+    if not missing:
+        return rendered
+
+    import matplotlib.pyplot as plt
+    fig = plot_window(sessions, start, end, days)
+    for fmt in missing:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt)
+        rendered[fmt] = buffer.getvalue()
+        if cache is not None:
+            cache.put(key, fmt, rendered[fmt])
+    plt.close(fig)
+    return rendered
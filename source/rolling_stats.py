@@ -0,0 +1,340 @@
+import argparse
+from collections import deque
+
+import numpy as np
+
+from profiling import add_arguments, enable_from_args, stage
+from session_store import file_path, load_sessions
+from sessions import MINUTES_PER_DAY, SessionArray, occupancy
+
+"""
+    Sleep hygiene over the last 7, 30 and 90 days, for every day:
+        mean_total   mean minutes slept per logged day
+        onset_std    circular std of the main sleep's onset, in minutes
+                     (23:50 and 00:10 are 20 minutes apart, not 23h40)
+        debt         sum of SLEEP_NEED - minutes slept, over logged days
+                     (negative when there was sleep to spare)
+        regularity   Sleep Regularity Index: how often the sleep/wake state
+                     is the same 24h apart, from -100 (never) to 100
+                     (always), on EPOCH_MINUTES epochs
+    Days without any session are taken as not logged rather than as no
+    sleep, so they don't count towards the means or the debt.
+    rolling_metrics() computes it all in one vectorized pass over the days,
+    RollingStats keeps running sums and updates them in O(1) per new day;
+    its update() is what the live stats (watch.py) use after an append.
+"""
+WINDOWS = (7, 30, 90)
+SLEEP_NEED = 8 * 60
+EPOCH_MINUTES = 5
+EPOCHS_PER_DAY = MINUTES_PER_DAY // EPOCH_MINUTES
+BLOCK_DAYS = 10_000  # Days of epochs painted at once in batch mode
+METRICS = ('mean_total', 'onset_std', 'debt', 'regularity')
+
+
+def paint_epochs(first_day, days, day, onset, duration):
+    """ (days, EPOCHS_PER_DAY) bool array, True for epochs asleep.
+        An epoch is asleep when its first minute is. Sessions past
+        midnight spill over into the next day's row, or are cut at the
+        last one.
+    """
+    return occupancy(first_day, days, day, onset,
+                     duration)[:, ::EPOCH_MINUTES] > 0
+
+
+def main_onsets(sessions):
+    """ (days, onsets) of the longest session of each day """
+    # Sorted by day then duration, the last of each day is the longest
+    order = np.lexsort((sessions.duration, sessions.day))
+    day = sessions.day[order]
+    last = np.r_[day[1:] != day[:-1], True]
+    return day[last], sessions.onset[order][last]
+
+
+def _circular_std(cos_sum, sin_sum, count):
+    """ Circular std in minutes of times of day, from their sums of
+        cos/sin (angle = minutes / MINUTES_PER_DAY turns)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        length = np.hypot(cos_sum, sin_sum) / count
+        radians = np.sqrt(np.maximum(
+            -2 * np.log(np.clip(length, 1e-12, 1)), 0))
+    return radians * MINUTES_PER_DAY / (2 * np.pi)
+
+
+def _angles(onset):
+    return 2 * np.pi * np.asarray(onset, dtype=float) / MINUTES_PER_DAY
+
+
+def _daily_series(sessions):
+    """ Dense per day arrays, from the first to the last logged day:
+        logged, total minutes, cos/sin of the main onset, and the
+        fraction of epochs in the same state as 24h before (NaN unless
+        both days are logged)
+    """
+    first_day, last_day = int(sessions.day[0]), int(sessions.day[-1])
+    days = last_day - first_day + 1
+    position = sessions.day - first_day
+    total = np.bincount(position, weights=sessions.duration, minlength=days)
+    logged = np.bincount(position, minlength=days) > 0
+    onset_days, onsets = main_onsets(sessions)
+    angle = _angles(onsets)
+    cos, sin = np.zeros(days), np.zeros(days)
+    cos[onset_days - first_day] = np.cos(angle)
+    sin[onset_days - first_day] = np.sin(angle)
+
+    # Agreement with the day before, a block of days at a time. Each block
+    # also paints the day before it, and the sessions of that day's eve
+    # that spill over into it.
+    agreement = np.full(days, np.nan)
+    for lo in range(1, days, BLOCK_DAYS):
+        hi = min(lo + BLOCK_DAYS, days)
+        start, stop = np.searchsorted(sessions.day,
+                                      [first_day + lo - 2, first_day + hi])
+        block = sessions[start:stop]
+        asleep = paint_epochs(first_day + lo - 1, hi - lo + 1, block.day,
+                              block.onset, block.duration)
+        agreement[lo:hi] = (asleep[1:] == asleep[:-1]).mean(axis=1)
+    agreement[1:][~(logged[1:] & logged[:-1])] = np.nan
+    agreement[0] = np.nan
+    return first_day, logged, total, cos, sin, agreement
+
+
+def _rolling_sum(values, window):
+    """ Sum of the last `window` values, at every position """
+    summed = np.cumsum(np.r_[0, values])
+    return summed[1:] - summed[np.maximum(np.arange(1, len(summed))
+                                          - window, 0)]
+
+
+def rolling_metrics(sessions, windows=WINDOWS, need=SLEEP_NEED):
+    """ DataFrame with one row per calendar day from the first to the last
+        logged day, and a <metric>_<window> column per metric and window.
+        Windows end on their row's day.
+    """
+    import pandas as pd
+    columns = {}
+    if not len(sessions):
+        return pd.DataFrame(columns=[f'{metric}_{window}'
+                                     for window in windows
+                                     for metric in METRICS])
+    with stage('rolling_metrics', rows=len(sessions)):
+        first_day, logged, total, cos, sin, agreement = \
+            _daily_series(sessions)
+        paired = ~np.isnan(agreement)
+        for window in windows:
+            count = _rolling_sum(logged, window)
+            slept = _rolling_sum(total, window)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns[f'mean_total_{window}'] = np.where(
+                    count > 0, slept / count, np.nan)
+                columns[f'onset_std_{window}'] = np.where(
+                    count > 0, _circular_std(_rolling_sum(cos, window),
+                                             _rolling_sum(sin, window),
+                                             count), np.nan)
+                columns[f'debt_{window}'] = np.where(
+                    count > 0, count * need - slept, np.nan)
+                # A window of n days holds n - 1 pairs of days
+                pairs = _rolling_sum(paired, window - 1)
+                same = _rolling_sum(np.where(paired, agreement, 0),
+                                    window - 1)
+                columns[f'regularity_{window}'] = np.where(
+                    pairs > 0, 200 * same / pairs - 100, np.nan)
+        index = np.arange(first_day, first_day + len(logged))
+        return pd.DataFrame(columns, index=index.astype('datetime64[D]'))
+
+
+def latest_metrics(metrics, windows=WINDOWS):
+    """ Last row of rolling_metrics(), shaped like RollingStats.metrics() """
+    latest = metrics.iloc[-1]
+    return {window: {metric: latest[f'{metric}_{window}']
+                     for metric in METRICS} for window in windows}
+
+
+class _Window:
+    """ Running sums of the per day values of the last `size` days.
+        The last push can be undone.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.sums = None
+        self.dropped = None  # What the last push moved out of the window
+
+    def push(self, values):
+        values = np.asarray(values, dtype=float)
+        self.values.append(values)
+        self.sums = values.copy() if self.sums is None \
+            else self.sums + values
+        self.dropped = None
+        if len(self.values) > self.size:
+            self.dropped = self.values.popleft()
+            self.sums -= self.dropped
+        return self.sums
+
+    def undo(self):
+        self.sums = self.sums - self.values.pop()
+        if self.dropped is not None:
+            self.values.appendleft(self.dropped)
+            self.sums += self.dropped
+            self.dropped = None
+
+
+class RollingStats:
+    """ The rolling_metrics of the latest day, kept up to date one day at
+        a time. Feed it whole days, in order:
+            stats = RollingStats()
+            for day in days:
+                stats.add_day(day, sessions_of_that_day)
+            stats.metrics()  # {window: {metric: value}}
+        or let update() find the new days in the whole session array.
+        Each day costs the same however long the history is.
+    """
+
+    def __init__(self, windows=WINDOWS, need=SLEEP_NEED):
+        self.windows, self.need = windows, need
+        # Per day: logged, total, cos, sin; per pair of days: paired, same
+        self.days = {window: _Window(window) for window in windows}
+        self.pairs = {window: _Window(window - 1) for window in windows}
+        self.last_day = None
+        self.spill = np.zeros(EPOCHS_PER_DAY, dtype=bool)
+        self.asleep = None
+        # Sessions added, and how many came before the last day
+        self.count = 0
+        self.count_before_last = 0
+        self.before_last = None  # What _undo() puts back
+
+    def update(self, sessions):
+        """ Catches up with sessions, the whole history (a SessionArray
+            sorted by day) after some were appended. Only the days from
+            the last added one on are gone through, that day again since
+            sessions may have been appended to it. When the sessions
+            before it aren't the ones added, it starts over, from the
+            last max(windows) + 1 days.
+            Returns the number of days added.
+        """
+        start = (0 if self.last_day is None
+                 else int(np.searchsorted(sessions.day, self.last_day)))
+        if self.last_day is not None and start == self.count_before_last:
+            self._undo()
+        else:
+            self.reset()
+            # Older days are out of every window; the day before the
+            # longest one is still needed, for what spills out of it
+            start = (int(np.searchsorted(
+                sessions.day, int(sessions.day[-1]) - max(self.windows)))
+                if len(sessions) else 0)
+            self.count = start
+        return self.extend(sessions[start:])
+
+    def reset(self):
+        """ Forgets every day, for when older sessions were edited """
+        self.__init__(self.windows, self.need)
+
+    def extend(self, sessions):
+        """ add_day for every day of sessions (sorted by day) """
+        days, starts = np.unique(sessions.day, return_index=True)
+        for day, lo, hi in zip(days, starts, np.r_[starts[1:],
+                                                     len(sessions)]):
+            self.add_day(day, sessions[lo:hi])
+        return len(days)
+
+    def add_day(self, day, sessions):
+        """ Adds a day and its sessions (a SessionArray, maybe empty).
+            Days skipped since the last one count as not logged.
+        """
+        day = int(day)
+        if self.last_day is not None:
+            if day <= self.last_day:
+                raise ValueError(f"Day {day} was already added")
+            for _ in range(day - self.last_day - 1):
+                self._push(self.last_day + 1, None)
+        self._push(day, sessions)
+
+    def _push(self, day, sessions):
+        self.before_last = (self.last_day, self.spill, self.asleep,
+                            self.count)
+        self.count_before_last = self.count
+        logged = sessions is not None and len(sessions) > 0
+        self.count += len(sessions) if logged else 0
+        if logged:
+            painted = paint_epochs(day, 2, sessions.day, sessions.onset,
+                                   sessions.duration)
+            asleep = painted[0] | self.spill
+            self.spill = painted[1]
+            longest = int(np.argmax(sessions.duration[::-1]))
+            angle = _angles(sessions.onset[len(sessions) - 1 - longest])
+            values = (1, sessions.duration.sum(), np.cos(angle),
+                      np.sin(angle))
+        else:
+            asleep, values = None, (0, 0, 0, 0)
+            self.spill = np.zeros(EPOCHS_PER_DAY, dtype=bool)
+        if asleep is not None and self.asleep is not None:
+            pair = (1, (asleep == self.asleep).mean())
+        else:
+            pair = (0, 0)
+        self.asleep = asleep
+        self.last_day = day
+        for window in self.days.values():
+            window.push(values)
+        for window in self.pairs.values():
+            window.push(pair)
+
+    def _undo(self):
+        """ Takes the last day back out """
+        self.last_day, self.spill, self.asleep, self.count = self.before_last
+        self.count_before_last = None  # Only one day can be taken out
+        for window in list(self.days.values()) + list(self.pairs.values()):
+            window.undo()
+
+    def metrics(self):
+        """ {window: {metric: value}}, NaN where there is nothing to use """
+        result = {}
+        for size, window in self.days.items():
+            count, slept, cos, sin = window.sums
+            paired, same = self.pairs[size].sums
+            if count:
+                std = float(_circular_std(cos, sin, count))
+                result[size] = {'mean_total': slept / count,
+                                'onset_std': std,
+                                'debt': count * self.need - slept}
+            else:
+                result[size] = dict.fromkeys(METRICS[:3], float('nan'))
+            result[size]['regularity'] = (200 * same / paired - 100
+                                          if paired else float('nan'))
+        return result
+
+
+def format_metrics(metrics):
+    """ Text table of RollingStats.metrics() """
+    lines = [f"{'days':>5} {'mean sleep':>11} {'onset std':>10} "
+             f"{'sleep debt':>11} {'regularity':>11}"]
+    for window, values in metrics.items():
+        lines.append(f"{window:>5} {values['mean_total'] / 60:>10.2f}h "
+                     f"{values['onset_std']:>7.0f}min "
+                     f"{values['debt'] / 60:>10.1f}h "
+                     f"{values['regularity']:>11.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rolling 7/30/90 day sleep hygiene metrics.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--output',
+                        help="write the metrics of every day to this csv")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+
+    sessions = SessionArray.from_frame(load_sessions(args.csv))
+    metrics = rolling_metrics(sessions)
+    if args.output:
+        metrics.to_csv(args.output, index_label='Date')
+    print(f"On {metrics.index[-1]:%d/%m/%Y}")
+    print(format_metrics(latest_metrics(metrics)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import hashlib
+import json
+from importlib.util import find_spec
+from pathlib import Path
+
+import numpy as np
+
+from parsers import minutes_or_raise
+from profiling import stage
+
+"""
+    Typed binary cache of the cleaned journal.
+    Parsing the HH:MM strings of the cleaned csv is most of the load time,
+    so the parsed sessions are kept next to it:
+        Date      datetime64 (NaT if the cell isn't DD/MM/YYYY)
+        Onset     int16, minutes since midnight
+        Wakeup    int16, minutes since midnight
+        Duration  int16, minutes
+    The cache is Feather when pyarrow is installed, a pandas pickle
+    otherwise. It gets rebuilt when the csv changes (mtime, then hash).
+    The dated sessions are also saved as SESSION_DTYPE records in a
+    .sessions.npy, which load_records reads without pandas.
+    pandas is only imported by the functions that need it.
+
+    For many journals (years of them, several people) there is also a
+    plain NumPy layout: one sessions.npy of fixed width SESSION_DTYPE
+    records, every user's sessions one after the other, and users.json
+    giving each user's [start, stop) offsets. np.load(..., mmap_mode='r')
+    maps it as a structured array, so reading one user or one date range
+    doesn't load the rest, and SessionArray wraps it as it is.
+"""
+# Looked up without importing it, pyarrow is slow to import
+CACHE_SUFFIX = '.feather' if find_spec('pyarrow') else '.pkl'
+
+script_dir = Path(__file__).parent
+file_path = script_dir.parent / "assets" / "sleep_journal_cleaned.csv"
+
+TIME_COLUMNS = ('Onset', 'Wakeup', 'Duration')
+# Field name -> dtype of a session record; day is days since 1970-01-01
+ARRAY_FIELDS = {'day': 'int32', 'onset': 'int16', 'wakeup': 'int16',
+                'duration': 'int16'}
+SESSION_DTYPE = np.dtype(list(ARRAY_FIELDS.items()))
+RECORDS_FILE = "sessions.npy"
+
+
+def cache_path(csv_path):
+    """ sleep_journal_cleaned.csv -> sleep_journal_cleaned.sessions.feather """
+    return Path(csv_path).with_suffix('.sessions' + CACHE_SUFFIX)
+
+
+def records_path(csv_path):
+    """ sleep_journal_cleaned.csv -> sleep_journal_cleaned.sessions.npy """
+    return Path(csv_path).with_suffix('.sessions.npy')
+
+
+def meta_path(csv_path):
+    """ Where the signature of the csv the cache was built from is kept """
+    return Path(csv_path).with_suffix('.sessions.json')
+
+
+def type_sessions(df):
+    """ Turns cleaned rows (all strings) into the typed session frame """
+    import pandas as pd
+    with stage('parse_dates', rows=len(df)):
+        df['Date'] = pd.to_datetime(df['Date'], format="%d/%m/%Y",
+                                    errors='coerce')
+    with stage('parse_times', rows=len(df)):
+        for column in TIME_COLUMNS:
+            df[column] = minutes_or_raise(df[column])
+    return df
+
+
+def parse_sessions(path_or_buffer):
+    """ Reads a cleaned csv into the typed session frame """
+    import pandas as pd
+    with stage('read_csv') as record:
+        df = pd.read_csv(path_or_buffer, dtype=str)
+        record['rows'] = len(df)
+    return type_sessions(df)
+
+
+def _signature(csv_path, with_hash=True):
+    stat = Path(csv_path).stat()
+    signature = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if with_hash:
+        digest = hashlib.sha256(Path(csv_path).read_bytes()).hexdigest()
+        signature['sha256'] = digest
+    return signature
+
+
+def _read_cache(cache):
+    import pandas as pd
+    if CACHE_SUFFIX == '.feather':
+        return pd.read_feather(cache)
+    return pd.read_pickle(cache)
+
+
+def _write_cache(df, csv_path):
+    cache = cache_path(csv_path)
+    if CACHE_SUFFIX == '.feather':
+        df.to_feather(cache)
+    else:
+        df.to_pickle(cache)
+    np.save(records_path(csv_path), sessions_to_records(df))
+    meta_path(csv_path).write_text(json.dumps(_signature(csv_path)))
+
+
+def write_cache(csv_path=file_path):
+    """ Parses the cleaned csv, writes the cache and returns the frame """
+    df = parse_sessions(csv_path)
+    _write_cache(df, csv_path)
+    return df
+
+
+def append_sessions(csv_path, new_rows):
+    """ Adds cleaned rows (still strings) that were just appended to the
+        csv, without parsing the older ones again.
+        The cache must have matched the csv before the append, ie the
+        csv still starts with the bytes the cache was built from;
+        otherwise the whole cache is rebuilt.
+    """
+    cache, meta_file = cache_path(csv_path), meta_path(csv_path)
+    if cache.exists() and meta_file.exists():
+        meta = json.loads(meta_file.read_text())
+        prefix = Path(csv_path).read_bytes()[:meta['size']]
+        if hashlib.sha256(prefix).hexdigest() == meta['sha256']:
+            import pandas as pd
+            df = pd.concat([_read_cache(cache),
+                            type_sessions(new_rows.copy())],
+                           ignore_index=True)
+            _write_cache(df, csv_path)
+            return df
+    return write_cache(csv_path)
+
+
+def load_sessions(csv_path=file_path):
+    """ Returns the typed session frame of a cleaned csv.
+        The cache is used as long as the csv is unchanged: same mtime and
+        size, or, if the file was only touched, the same content hash.
+    """
+    cache, meta_file = cache_path(csv_path), meta_path(csv_path)
+    if cache.exists() and meta_file.exists():
+        meta = json.loads(meta_file.read_text())
+        quick = _signature(csv_path, with_hash=False)
+        if all(meta[key] == quick[key] for key in quick):
+            with stage('read_cache') as record:
+                df = _read_cache(cache)
+                record['rows'] = len(df)
+            if not records_path(csv_path).exists():  # Older caches
+                np.save(records_path(csv_path), sessions_to_records(df))
+            return df
+        signature = _signature(csv_path)
+        if signature['sha256'] == meta['sha256']:
+            # Touched but not changed: remember the new mtime
+            meta_file.write_text(json.dumps(signature))
+            return _read_cache(cache)
+    return write_cache(csv_path)
+
+
+def load_records(csv_path=file_path):
+    """ The dated sessions of a cleaned csv as SESSION_DTYPE records,
+        memory-mapped from the .sessions.npy cache, without pandas.
+        None when the cache is missing or the csv's mtime or size
+        changed: load_sessions then checks and rebuilds it.
+    """
+    records, meta_file = records_path(csv_path), meta_path(csv_path)
+    if not (records.exists() and meta_file.exists()):
+        return None
+    meta = json.loads(meta_file.read_text())
+    quick = _signature(csv_path, with_hash=False)
+    if any(meta[key] != quick[key] for key in quick):
+        return None
+    return np.load(records, mmap_mode='r')
+
+
+def day_number(date):
+    """ Any date-like value -> days since 1970-01-01 """
+    import pandas as pd
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype('int64'))
+
+
+def sessions_to_arrays(df):
+    """ Typed session frame -> dict of fixed width arrays.
+        Rows without a date are left out, and the rest is sorted by
+        (day, onset) so a date range is a searchsorted away.
+    """
+    df = df.dropna(subset=['Date'])
+    day = df['Date'].to_numpy().astype('datetime64[D]').astype('int32')
+    onset = df['Onset'].to_numpy(dtype='int16')
+    order = np.lexsort((onset, day))
+    return {
+        'day': day[order],
+        'onset': onset[order],
+        'wakeup': df['Wakeup'].to_numpy(dtype='int16')[order],
+        'duration': df['Duration'].to_numpy(dtype='int16')[order],
+    }
+
+
+def sessions_to_records(df):
+    """ Typed session frame -> SESSION_DTYPE records, as sessions_to_arrays
+    """
+    arrays = sessions_to_arrays(df)
+    records = np.empty(len(arrays['day']), dtype=SESSION_DTYPE)
+    for field in ARRAY_FIELDS:
+        records[field] = arrays[field]
+    return records
+
+
+def write_arrays(store_dir, sessions_by_user):
+    """ Writes {user: typed session frame} as the .npy layout """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    index = {}
+    pieces = []
+    offset = 0
+    for user, df in sessions_by_user.items():
+        pieces.append(sessions_to_records(df))
+        index[user] = [offset, offset + len(pieces[-1])]
+        offset += len(pieces[-1])
+    records = np.concatenate(pieces or [np.empty(0, dtype=SESSION_DTYPE)])
+    np.save(store_dir / RECORDS_FILE, records)
+    (store_dir / "users.json").write_text(json.dumps(index))
+
+
+def list_users(store_dir):
+    """ Users of an array store, in storage order """
+    return list(json.loads((Path(store_dir) / "users.json").read_text()))
+
+
+def open_arrays(store_dir, user=None, start=None, end=None):
+    """ Memory-maps the .npy layout and returns a read-only structured
+        view of SESSION_DTYPE records (what SessionArray takes).
+        user picks one user's block; start (included) and end (excluded)
+        narrow it to a date range with searchsorted. Nothing is copied.
+        A date range needs a user when the store holds several.
+    """
+    store_dir = Path(store_dir)
+    index = json.loads((store_dir / "users.json").read_text())
+    records = np.load(store_dir / RECORDS_FILE, mmap_mode='r')
+    if user is None and len(index) == 1:
+        user = next(iter(index))
+    if user is None:
+        if start is not None or end is not None:
+            raise ValueError("A date range needs a user when the store "
+                             f"holds several: {sorted(index)}")
+        return records
+    lo, hi = index[user]
+    days = records['day'][lo:hi]
+    if end is not None:
+        hi = lo + int(np.searchsorted(days, day_number(end), 'left'))
+    if start is not None:
+        lo = lo + int(np.searchsorted(days, day_number(start), 'left'))
+    return records[lo:hi]
@@ -0,0 +1,299 @@
+import numpy as np
+
+from session_store import SESSION_DTYPE, day_number, sessions_to_records
+
+"""
+    One representation of a sleep session for every plot and statistic:
+        SleepSession  a single session, a small __slots__ record
+        SessionArray  many sessions, a NumPy structured array with
+                      vectorized accessors
+    All times are minutes: onset and wakeup since midnight, duration long.
+    The helpers below work the same on plain ints and on arrays, so both
+    classes share them.
+"""
+MINUTES_PER_DAY = 24 * 60
+
+# classify() labels, in the order of their codes
+SESSION_KINDS = ('night', 'day-sleep', 'nap', 'fragmented')
+NIGHT, DAY_SLEEP, NAP, FRAGMENTED = range(len(SESSION_KINDS))
+NAP_MAX_MINUTES = 90  # Naps are at most 1h30
+FRAGMENT_GAP_MINUTES = 60  # Less awake time than this between two sessions
+FRAGMENT_MAX_MINUTES = 4 * 60  # ...makes the shorter ones fragments
+NIGHT_MIDPOINT_END = 8 * 60  # Night sleep is mostly over by 8AM
+
+
+def end_minute(onset, duration):
+    """ Minutes since the session's start day's midnight (can be > 1440) """
+    return np.asarray(onset, dtype='i4') + duration
+
+
+def midpoint(onset, duration):
+    """ Middle of the session, in minutes since midnight """
+    return end_minute(onset, np.asarray(duration) // 2) % MINUTES_PER_DAY
+
+
+def ends_past_midnight(onset, duration):
+    return end_minute(onset, duration) > MINUTES_PER_DAY
+
+
+def is_night(onset):
+    """ Night sleep starts between 8PM and 3AM (3:59 included) """
+    hour = np.asarray(onset) // 60
+    return (hour >= 20) | (hour <= 3)
+
+
+def classify(day, onset, duration):
+    """ SESSION_KINDS code (int8) of each session, sessions sorted by day
+        and onset. In order of precedence:
+            fragmented  under FRAGMENT_MAX_MINUTES, and less than
+                        FRAGMENT_GAP_MINUTES away from the session before
+                        or after it (broken up sleep)
+            nap         up to NAP_MAX_MINUTES
+            night       starts at night (is_night), or its midpoint is
+                        between midnight and NIGHT_MIDPOINT_END
+            day-sleep   the other long sessions
+        The gaps come from shifting the start and end arrays by one.
+    """
+    onset = np.asarray(onset, dtype='i8')
+    duration = np.asarray(duration, dtype='i8')
+    start = np.asarray(day, dtype='i8') * MINUTES_PER_DAY + onset
+    end = start + duration
+    # No neighbour at the ends: an infinite gap
+    gap_before = np.r_[np.inf, start[1:] - end[:-1]]
+    gap_after = np.r_[start[1:] - end[:-1], np.inf]
+    close = np.minimum(gap_before, gap_after) < FRAGMENT_GAP_MINUTES
+    night = is_night(onset) | (midpoint(onset, duration) < NIGHT_MIDPOINT_END)
+    return np.select([close & (duration < FRAGMENT_MAX_MINUTES),
+                      duration <= NAP_MAX_MINUTES, night],
+                     [FRAGMENTED, NAP, NIGHT], default=DAY_SLEEP) \
+        .astype('i1')
+
+
+def as_categorical(codes):
+    """ classify() codes as a pandas Categorical of SESSION_KINDS """
+    import pandas as pd
+    return pd.Categorical.from_codes(codes, categories=SESSION_KINDS)
+
+
+def occupancy(first_day, days, day, onset, duration):
+    """ (days, MINUTES_PER_DAY) uint8 array: how many sessions cover each
+        minute of days first_day..first_day + days - 1.
+        The days are laid end to end, each session adds 1 where it starts
+        and -1 where it ends, and a cumulative sum paints the minutes in
+        between; so sessions past midnight simply go on into the next
+        row. Whatever falls outside the days is cut off.
+    """
+    size = days * MINUTES_PER_DAY
+    start = ((np.asarray(day, dtype='i8') - first_day) * MINUTES_PER_DAY
+             + np.asarray(onset, dtype='i8'))
+    end = start + np.asarray(duration, dtype='i8')
+    change = (np.bincount(np.clip(start, 0, size), minlength=size + 1)
+              - np.bincount(np.clip(end, 0, size), minlength=size + 1))
+    counts = np.cumsum(change[:-1])
+    return np.minimum(counts, 255).astype('u1').reshape(days,
+                                                        MINUTES_PER_DAY)
+
+
+def split_at_midnight(day, onset, duration):
+    """ Cuts sessions that go past midnight in two, in one array pass.
+        Returns {'day', 'left', 'width', 'index', 'main'} segment arrays:
+            the part before midnight stays on its day,
+            the part after midnight goes at 00:00 on the next day,
+            index points back to the session each segment comes from,
+            main marks the wider segment of each session (for labels).
+        A duration is at most 23:59, so there are never more than 2 parts.
+    """
+    day = np.asarray(day)
+    onset = np.asarray(onset, dtype='i4')
+    end = end_minute(onset, duration)
+    first_width = np.minimum(end, MINUTES_PER_DAY) - onset
+    spill = np.maximum(end - MINUTES_PER_DAY, 0)
+    crosses = np.flatnonzero(spill > 0)
+    return {
+        'day': np.concatenate([day, day[crosses] + 1]),
+        'left': np.concatenate([onset, np.zeros(len(crosses), 'i4')]),
+        'width': np.concatenate([first_width, spill[crosses]]),
+        'index': np.concatenate([np.arange(len(day)), crosses]),
+        'main': np.concatenate([first_width >= spill,
+                                spill[crosses] > first_width[crosses]]),
+    }
+
+
+class SleepSession:
+    __slots__ = ('day', 'onset', 'wakeup', 'duration')
+
+    def __init__(self, day, onset, wakeup, duration):
+        self.day = int(day)
+        self.onset = int(onset)
+        self.wakeup = int(wakeup)
+        self.duration = int(duration)
+
+    def __repr__(self):
+        return (f"SleepSession({self.date}, {self.onset // 60:02d}:"
+                f"{self.onset % 60:02d}, {self.duration} min)")
+
+    def __eq__(self, other):
+        if not isinstance(other, SleepSession):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    @property
+    def date(self):
+        return np.datetime64(self.day, 'D')
+
+    @property
+    def midpoint(self):
+        return int(midpoint(self.onset, self.duration))
+
+    @property
+    def ends_past_midnight(self):
+        return bool(ends_past_midnight(self.onset, self.duration))
+
+    @property
+    def is_night(self):
+        return bool(is_night(self.onset))
+
+
+class SessionArray:
+    """ Sessions as one structured array of SESSION_DTYPE. A structured
+        array of that dtype is wrapped as it is, so the read-only memmap
+        of open_arrays is plotted and summarized in place, never copied;
+        slices (window()) are views of it too.
+        window() expects the sessions sorted by day, which is how
+        from_frame and open_arrays give them.
+    """
+
+    def __init__(self, records):
+        self.records = np.asarray(records, dtype=SESSION_DTYPE)
+
+    @classmethod
+    def from_arrays(cls, day, onset, wakeup, duration):
+        """ Builds it from separate field arrays (copied into records) """
+        records = np.empty(len(day), dtype=SESSION_DTYPE)
+        records['day'] = day
+        records['onset'] = onset
+        records['wakeup'] = wakeup
+        records['duration'] = duration
+        return cls(records)
+
+    @classmethod
+    def from_frame(cls, df):
+        """ Builds it from a typed session frame (load_sessions) """
+        return cls(sessions_to_records(df))
+
+    @property
+    def fields(self):
+        """ {field: view of that field}, what from_arrays takes """
+        return {field: self.records[field] for field in SESSION_DTYPE.names}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return SleepSession(*self.records[key])
+        return SessionArray(self.records[key])
+
+    def __iter__(self):
+        for record in self.records:
+            yield SleepSession(*record)
+
+    @property
+    def day(self):
+        return self.records['day']
+
+    @property
+    def onset(self):
+        return self.records['onset']
+
+    @property
+    def wakeup(self):
+        return self.records['wakeup']
+
+    @property
+    def duration(self):
+        return self.records['duration']
+
+    @property
+    def dates(self):
+        return self.day.astype('datetime64[D]')
+
+    @property
+    def end(self):
+        return end_minute(self.onset, self.duration)
+
+    @property
+    def midpoint(self):
+        return midpoint(self.onset, self.duration)
+
+    @property
+    def ends_past_midnight(self):
+        return ends_past_midnight(self.onset, self.duration)
+
+    @property
+    def is_night(self):
+        return is_night(self.onset)
+
+    def split_at_midnight(self):
+        return split_at_midnight(self.day, self.onset, self.duration)
+
+    @property
+    def kind_codes(self):
+        """ classify() codes, as int8 """
+        return classify(self.day, self.onset, self.duration)
+
+    @property
+    def kinds(self):
+        """ night / day-sleep / nap / fragmented, as a Categorical (for a
+            DataFrame column: df['Kind'] = sessions.kinds)
+        """
+        return as_categorical(self.kind_codes)
+
+    def window_bounds(self, start=None, end=None, days=None):
+        """ First and last day numbers (both included) of a window:
+                days alone       the last `days` days of the journal
+                start + days     `days` days from start
+                end + days       `days` days up to end
+                start and/or end from start to end
+            None for a side means that side is open.
+        """
+        first = None if start is None else day_number(start)
+        last = None if end is None else day_number(end)
+        if days is not None:
+            if first is not None and last is not None:
+                raise ValueError("Give at most two of start, end and days")
+            if first is None and last is None:
+                last = int(self.day[-1]) if len(self) else None
+            if first is None and last is not None:
+                first = last - days + 1
+            elif first is not None:
+                last = first + days - 1
+        return first, last
+
+    def window(self, start=None, end=None, days=None, eve=False):
+        """ Sessions of a window (see window_bounds), found with
+            searchsorted on the sorted days. The result is a view,
+            nothing gets copied.
+            eve=True adds the sessions of the day before the window,
+            whose end can spill over midnight into its first day.
+        """
+        return self[self._window_slice(start, end, days, eve)]
+
+    def _window_slice(self, start=None, end=None, days=None, eve=False):
+        first, last = self.window_bounds(start, end, days)
+        if first is not None and eve:
+            first -= 1
+        lo = 0 if first is None else np.searchsorted(self.day, first, 'left')
+        hi = (len(self) if last is None
+              else np.searchsorted(self.day, last, 'right'))
+        return slice(int(lo), int(hi))
+
+    def window_kind_codes(self, start=None, end=None, days=None, eve=False):
+        """ classify() codes of window(...). The sessions just outside
+            the window are looked at too, for the gaps at its edges.
+        """
+        span = self._window_slice(start, end, days, eve)
+        lo = max(span.start - 1, 0)
+        codes = self[lo:span.stop + 1].kind_codes
+        return codes[span.start - lo:span.stop - lo]
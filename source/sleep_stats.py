@@ -0,0 +1,202 @@
+import argparse
+from functools import cached_property
+
+import numpy as np
+
+from day_index import build_day_index, load_day_index, weekly
+from profiling import add_arguments, enable_from_args, stage
+from rolling_stats import RollingStats, format_metrics
+from session_store import file_path, load_records, load_sessions
+from sessions import NIGHT, SESSION_KINDS, SessionArray
+
+"""
+    Statistics on the sleep journal.
+    SleepDataset loads the journal once; every aggregate is computed the
+    first time it's asked for and then kept, so the plot and the stats
+    report share the same load, parse and groupings.
+    Daily and weekly totals are read from the calendar index (day_index)
+    instead of grouping the sessions, and the rolling metrics from a
+    RollingStats, which watch.py keeps between refreshes.
+    pandas and matplotlib are imported where they're used, so the text
+    report never loads matplotlib, and doesn't load pandas either when
+    the dataset comes from load_light().
+"""
+
+
+class SleepDataset:
+
+    def __init__(self, sessions, days=None, rolling_stats=None):
+        self.sessions = sessions
+        if days is not None:
+            self.days = days
+        if rolling_stats is not None:
+            # Kept from an earlier dataset, only the new days are added
+            rolling_stats.update(sessions)
+            self.rolling_stats = rolling_stats
+
+    @classmethod
+    def load(cls, csv_path=file_path, rolling_stats=None):
+        df = load_sessions(csv_path)
+        return cls(SessionArray.from_frame(df), load_day_index(csv_path, df),
+                   rolling_stats)
+
+    @classmethod
+    def load_light(cls, csv_path=file_path):
+        """ The sessions alone, memory-mapped from the .npy cache
+            (session_store.load_records), so nothing needs pandas: enough
+            for format_stats. load() when that cache isn't current.
+        """
+        records = load_records(csv_path)
+        if records is None:
+            return cls.load(csv_path)
+        return cls(SessionArray(records))
+
+    @cached_property
+    def days(self):
+        """ The calendar index, built here when load() didn't read it """
+        return build_day_index(self.sessions)
+
+    @cached_property
+    def duration_thresholds(self):
+        """ (mean, std) of session durations, for the plot colours """
+        duration = self.sessions.duration
+        return float(duration.mean()), float(duration.std(ddof=1))
+
+    @cached_property
+    def daily_sleep(self):
+        """ Total minutes slept per day, for days with sleep.
+            A Series indexed by date.
+        """
+        logged = self.days[self.days['sessions'] > 0]
+        return logged['total_minutes'].astype(float).rename(
+            'DurationMinutes')
+
+    @cached_property
+    def daily_minutes(self):
+        """ daily_sleep as a plain float array, counted from the sessions
+            with np.bincount (same totals as the calendar index), so the
+            text report doesn't need the index or pandas
+        """
+        position = self.sessions.day - self.sessions.day[0]
+        totals = np.bincount(position, weights=self.sessions.duration)
+        return totals[np.bincount(position) > 0]
+
+    @cached_property
+    def weekly_sleep(self):
+        """ Mean session length per week (Monday to Sunday), indexed by
+            the week's Monday
+        """
+        weeks = weekly(self.days)
+        weeks = weeks[weeks['sessions'] > 0]
+        return (weeks['total_minutes'] / weeks['sessions']).rename(
+            'DurationMinutes')
+
+    @cached_property
+    def rolling_stats(self):
+        """ RollingStats of the last day (rolling_stats), built here when
+            none was given
+        """
+        stats = RollingStats()
+        with stage('rolling_stats', rows=len(self.sessions)):
+            stats.update(self.sessions)
+        return stats
+
+    @cached_property
+    def kinds(self):
+        """ night / day-sleep / nap / fragmented of every session """
+        return self.sessions.kinds
+
+    @cached_property
+    def night_sessions(self):
+        """ Sessions classified as night sleep, as in the kinds line and
+            day_index's night_minutes
+        """
+        return int((self.sessions.kind_codes == NIGHT).sum())
+
+    @cached_property
+    def kind_counts(self):
+        """ {kind: sessions}, most common first (like value_counts) """
+        counts = np.bincount(self.sessions.kind_codes,
+                             minlength=len(SESSION_KINDS))
+        order = np.argsort(-counts, kind='stable')
+        return {SESSION_KINDS[code]: int(counts[code]) for code in order}
+
+
+def format_stats(dataset):
+    """ The text report, as one string """
+    hours = dataset.daily_minutes / 60
+    day_count = len(hours)
+    over_8 = int((hours > 8).sum())
+    under_6 = int((hours < 6).sum())
+    nights = dataset.night_sessions
+    kinds = dataset.kind_counts
+    last_day = np.datetime64(dataset.rolling_stats.last_day, 'D').item()
+    return "\n".join([
+        "===== Sleep Statistics =====",
+        f"Average daily sleep: {hours.mean():.2f} hours",
+        f"Standard deviation: {hours.std(ddof=1):.2f} hours",
+        f"Days with >8 hours: {over_8} ({over_8 / day_count * 100:.1f}%)",
+        f"Days with <6 hours: {under_6} ({under_6 / day_count * 100:.1f}%)",
+        f"Night sleep sessions: {nights} "
+        f"({nights / len(dataset.sessions) * 100:.1f}%)",
+        "Sessions by kind: " + ", ".join(f"{kind} {count}"
+                                         for kind, count in kinds.items()),
+        f"----- Last days, to {last_day:%d/%m/%Y} -----",
+        format_metrics(dataset.rolling_stats.metrics()),
+    ])
+
+
+def show_sleep_stats(dataset):
+    """ Prints the report and returns the histogram of daily sleep """
+    import matplotlib.pyplot as plt
+    hours = dataset.daily_sleep / 60
+    avg_daily_sleep = hours.mean()
+    std_daily_sleep = hours.std()
+
+    # Plot histogram of daily sleep duration
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.hist(hours, bins=24, color='skyblue', edgecolor='black')
+    ax.axvline(avg_daily_sleep, color='red', linestyle='dashed',
+               linewidth=2, label=f'Average: {avg_daily_sleep:.2f}h')
+    ax.axvline(avg_daily_sleep - std_daily_sleep, color='orange',
+               linestyle='dashed', linewidth=1,
+               label=f'-1 Std: {avg_daily_sleep - std_daily_sleep:.2f}h')
+    ax.axvline(avg_daily_sleep + std_daily_sleep, color='green',
+               linestyle='dashed', linewidth=1,
+               label=f'+1 Std: {avg_daily_sleep + std_daily_sleep:.2f}h')
+
+    ax.set_title('Distribution of Daily Sleep Duration')
+    ax.set_xlabel('Sleep Duration (hours)')
+    ax.set_ylabel('Number of Days')
+    ax.grid(axis='y', alpha=0.75)
+    ax.legend()
+
+    print(format_stats(dataset))
+    fig.tight_layout()
+    return fig
+
+
+def main(argv=None):
+    """ The sleep plot and the statistics, from a single load """
+    parser = argparse.ArgumentParser(
+        description="Plot the last days of sleep and show statistics.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--days', type=int, default=30,
+                        help="days to plot (default: %(default)s)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    enable_from_args(args)
+
+    import matplotlib.pyplot as plt
+    from plot_script import plot_window
+    dataset = SleepDataset.load(args.csv)
+    plot_window(dataset.sessions, days=args.days,
+                thresholds=dataset.duration_thresholds)
+    with stage('stats_report', rows=len(dataset.sessions)):
+        show_sleep_stats(dataset)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import math
+
+import numpy as np
+
+from heatmap import BIN_MINUTES, draw_heatmap, heatmap_array
+from plot_script import draw_sessions
+from session_store import file_path, load_sessions
+from sessions import MINUTES_PER_DAY, SessionArray
+
+"""
+    Interactive, zoomable view of the whole journal:
+        python viewer.py [--days 60]
+    Zoomed out (more than DETAIL_MAX_DAYS rows on screen) it shows the
+    heatmap, one image for the whole history. Zoomed in it shows the
+    session bars and their labels, but only for the rows on screen plus
+    a margin, so panning a little doesn't draw anything new.
+    Text is what takes matplotlib the longest to draw, so the labels
+    only show from LABEL_MAX_DAYS rows, and the ones in the margin are
+    hidden until they scroll into view.
+    The y axis is the day number since the first day, with dates as tick
+    labels, like plot_window.
+"""
+DETAIL_MAX_DAYS = 120  # Session bars when at most this many rows show
+LABEL_MAX_DAYS = 40  # Duration labels when at most this many rows show
+MARGIN = 0.5  # Bars are drawn this many viewports above and below
+
+
+class SleepViewer:
+
+    def __init__(self, sessions, ax, detail_days=DETAIL_MAX_DAYS,
+                 bin_minutes=BIN_MINUTES):
+        from matplotlib.ticker import FuncFormatter, MaxNLocator
+        self.sessions = sessions
+        self.ax = ax
+        self.detail_days = detail_days
+        self.first_day = int(sessions.day[0])
+        self.day_count = int(sessions.day[-1]) - self.first_day + 2
+        # Whole history values, computed once
+        self.thresholds = (float(sessions.duration.mean()),
+                           float(sessions.duration.std(ddof=1)))
+        self.kind_codes = sessions.kind_codes
+        raster = heatmap_array(sessions, self.first_day,
+                               self.first_day + self.day_count - 1,
+                               bin_minutes)
+        self.image = draw_heatmap(ax, raster, self.day_count, bin_minutes)
+
+        # What is drawn: bars, labels (and where they are), and the rows
+        # and x span they cover
+        self.bars, self.labels = None, []
+        self.label_xy = np.empty((0, 2))
+        self.drawn = None
+
+        ax.set_xlim(0, MINUTES_PER_DAY)
+        ax.set_ylim(-0.5, self.day_count - 0.5)
+        ax.set_xticks(range(0, MINUTES_PER_DAY + 1, 120))
+        ax.set_xticklabels([f"{h:02d}:00" for h in range(0, 25, 2)])
+        ax.yaxis.set_major_locator(MaxNLocator(nbins=12, integer=True))
+        ax.yaxis.set_major_formatter(FuncFormatter(self._date_label))
+        ax.set_xlabel('Time of Day')
+        ax.set_ylabel('Date')
+        ax.set_title('Sleep Journal (zoom in for sessions)')
+        ax.callbacks.connect('xlim_changed', self.update)
+        ax.callbacks.connect('ylim_changed', self.update)
+        self.update()
+
+    def _date_label(self, row, position=None):
+        return str(np.datetime64(self.first_day + int(round(row)), 'D'))
+
+    def _clear_detail(self):
+        if self.bars is not None:
+            self.bars.remove()
+        for label in self.labels:
+            label.remove()
+        self.bars, self.labels = None, []
+        self.label_xy = np.empty((0, 2))
+        self.drawn = None
+
+    def update(self, ax=None):
+        """ Picks the level of detail for the current view. Called on
+            every pan/zoom step, so it returns early when what is drawn
+            still covers the view.
+        """
+        bottom, top = sorted(self.ax.get_ylim())
+        left, right = sorted(self.ax.get_xlim())
+        shown = top - bottom
+        if shown > self.detail_days:
+            self._clear_detail()
+            self.image.set_visible(True)
+            return
+        self.image.set_visible(False)
+        span = right - left
+        covered = False
+        if self.drawn is not None:
+            lo, hi, drawn_span = self.drawn
+            covered = lo <= bottom and top <= hi and drawn_span == span
+        if not covered:
+            self._clear_detail()
+            lo = max(math.floor(bottom - MARGIN * shown), 0)
+            hi = min(math.ceil(top + MARGIN * shown), self.day_count)
+            self._draw_rows(lo, hi, span)
+            self.drawn = (lo, hi, span)
+        x, y = self.label_xy.T
+        visible = ((shown <= LABEL_MAX_DAYS) & (x >= left) & (x <= right)
+                   & (y >= bottom) & (y <= top))
+        for label, show in zip(self.labels, visible):
+            label.set_visible(bool(show))
+
+    def _draw_rows(self, lo, hi, span):
+        """ Bars and labels of rows lo..hi, and no others """
+        # The day before the first row, for what spills over midnight
+        start, stop = np.searchsorted(
+            self.sessions.day, [self.first_day + lo - 1,
+                                self.first_day + hi + 1])
+        window = self.sessions[start:stop]
+        self.bars, self.labels = draw_sessions(
+            self.ax, window, self.first_day, *self.thresholds,
+            kind_codes=self.kind_codes[start:stop], minutes_shown=span)
+        self.label_xy = np.array([label.get_position()
+                                  for label in self.labels]).reshape(-1, 2)
+
+
+def main(argv=None):
+    """ python viewer.py [--csv journal.csv] [--days N] """
+    parser = argparse.ArgumentParser(
+        description="Zoomable view of the whole sleep journal.")
+    parser.add_argument('--csv', default=file_path,
+                        help="cleaned journal (default: %(default)s)")
+    parser.add_argument('--days', type=int,
+                        help="start zoomed on the last N days (default: "
+                             "the whole history)")
+    args = parser.parse_args(argv)
+
+    import matplotlib.pyplot as plt
+    sessions = SessionArray.from_frame(load_sessions(args.csv))
+    fig, ax = plt.subplots(figsize=(12, 8))
+    viewer = SleepViewer(sessions, ax)
+    if args.days:
+        ax.set_ylim(viewer.day_count - args.days - 0.5,
+                    viewer.day_count - 0.5)
+    fig.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
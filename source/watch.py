@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg')  # Renders to files, from a worker thread
+
+from csv_cleaner import START_YEAR, file_path, output_path, \
+    update_incremental
+from render_cache import RenderCache, render_window, write_atomic
+from rolling_stats import RollingStats
+from sleep_stats import SleepDataset, format_stats
+
+"""
+    Keeps the cleaned journal, its caches, a plot and the stats up to date
+    while the raw journal is being edited:
+        python watch.py [--days 30]
+    The journal is polled (stat only) every --interval seconds. A save
+    is handled once the file has stopped changing for --debounce
+    seconds, so a burst of writes (LibreOffice writes a temp file, then
+    renames it) gives one refresh.
+    A refresh is the incremental clean: only the lines added since the
+    last one are cleaned, and a half written last line is left for the
+    next save. The rolling metrics are kept in a RollingStats that only
+    goes through the new days. It runs in a thread, so the polling goes
+    on meanwhile.
+    Editing older lines still needs (and gets) a full rebuild.
+"""
+script_dir = Path(__file__).parent
+plot_path = script_dir.parent / "assets" / "sleep_plot.png"
+stats_path = script_dir.parent / "assets" / "sleep_stats.txt"
+
+POLL_SECONDS = 0.5
+DEBOUNCE_SECONDS = 1.0
+
+
+def file_signature(path):
+    """ (inode, size, mtime) of a file, None while it doesn't exist
+        (between the delete and the rename of a save)
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def refresh(input_path=file_path, output=output_path,
+            start_year=START_YEAR, plot=plot_path, stats=stats_path,
+            days=30, cache=None, rolling_stats=None):
+    """ Incremental clean, then the plot of the last days and the stats.
+        Nothing is drawn again when no line was added and both files are
+        there. rolling_stats is a RollingStats kept between refreshes.
+        Returns a one line summary.
+    """
+    start = time.perf_counter()
+    df, rebuilt = update_incremental(input_path, output, start_year)
+    if not rebuilt and not len(df) and Path(plot).exists() \
+            and Path(stats).exists():
+        return "no new line"
+    if rebuilt and rolling_stats is not None:
+        rolling_stats.reset()  # Older lines may have changed
+    dataset = SleepDataset.load(output, rolling_stats)
+    rendered = render_window(dataset.sessions, days=days, cache=cache)
+    write_atomic(plot, rendered['png'])
+    write_atomic(stats, (format_stats(dataset) + "\n").encode())
+    mode = "rebuilt" if rebuilt else f"{len(df)} new lines"
+    return f"{mode}, refreshed in {time.perf_counter() - start:.2f}s"
+
+
+async def watch(input_path=file_path, output=output_path,
+                start_year=START_YEAR, plot=plot_path, stats=stats_path,
+                days=30, interval=POLL_SECONDS, debounce=DEBOUNCE_SECONDS,
+                log=sys.stderr):
+    """ Refreshes once, then after every save, until cancelled """
+    loop = asyncio.get_running_loop()
+    cache = RenderCache()
+    rolling_stats = RollingStats()
+
+    async def run_refresh():
+        try:
+            summary = await asyncio.to_thread(
+                refresh, input_path, output, start_year, plot, stats, days,
+                cache, rolling_stats)
+        except Exception as error:  # A bad save mustn't stop the watch
+            summary = f"FAILED, {type(error).__name__}: {error}"
+        print(f"{time.strftime('%H:%M:%S')} {summary}", file=log)
+
+    handled = file_signature(input_path)
+    await run_refresh()
+    seen, changed_at = handled, loop.time()
+    while True:
+        await asyncio.sleep(interval)
+        signature = file_signature(input_path)
+        if signature is None:
+            continue
+        if signature != seen:
+            seen, changed_at = signature, loop.time()
+            continue
+        if signature != handled and loop.time() - changed_at >= debounce:
+            handled = signature
+            await run_refresh()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-clean the journal and refresh the plot and stats "
+                    "whenever it is saved.")
+    parser.add_argument('input', nargs='?', default=file_path,
+                        help="raw journal csv (default: %(default)s)")
+    parser.add_argument('output', nargs='?', default=output_path,
+                        help="cleaned csv (default: %(default)s)")
+    parser.add_argument('--start-year', type=int, default=START_YEAR)
+    parser.add_argument('--plot', default=plot_path,
+                        help="plot to keep up to date (default: "
+                             "%(default)s)")
+    parser.add_argument('--stats', default=stats_path,
+                        help="stats text to keep up to date (default: "
+                             "%(default)s)")
+    parser.add_argument('--days', type=int, default=30,
+                        help="days to plot (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS,
+                        help="seconds between polls (default: "
+                             "%(default)s)")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS,
+                        help="seconds the file must stay unchanged "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    print(f"Watching {args.input}, Ctrl-C to stop", file=sys.stderr)
+    try:
+        asyncio.run(watch(args.input, args.output, args.start_year,
+                          args.plot, args.stats, args.days, args.interval,
+                          args.debounce))
+    except KeyboardInterrupt:
+        print("Stopped", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from anomalies import sweep_overlaps
+
+
+def brute_force(start, end):
+    """ {position: (duplicate, minutes, furthest end before it)} from
+        comparing every pair, in the sweep's (start, end, row) order
+    """
+    found = {}
+    key = sorted(range(len(start)), key=lambda i: (start[i], end[i], i))
+    for n, i in enumerate(key):
+        before = key[:n]
+        copies = [j for j in before if (start[j], end[j]) == (start[i], end[i])]
+        hits = [j for j in before if start[i] < end[j]]
+        if copies:
+            found[i] = (True, end[i] - start[i], None)
+        elif hits:
+            reach = max(end[j] for j in before)
+            found[i] = (False, min(end[i], reach) - start[i], reach)
+    return found
+
+
+def check(start, end):
+    start, end = np.asarray(start, dtype='i8'), np.asarray(end, dtype='i8')
+    position, other, minutes, duplicate = sweep_overlaps(start, end)
+    expected = brute_force(start.tolist(), end.tolist())
+    assert sorted(position.tolist()) == sorted(expected)
+    for i, j, overlap, copy in zip(position, other, minutes, duplicate):
+        is_copy, expected_minutes, reach = expected[i]
+        assert (copy, overlap) == (is_copy, expected_minutes)
+        if copy:
+            assert (start[j], end[j]) == (start[i], end[i]) and j != i
+        else:
+            assert end[j] == reach
+
+
+def test_copy_after_longer_session():
+    # The third is a copy of the first, not an overlap of the second
+    start, end = [600, 600, 600], [660, 700, 660]
+    position, other, minutes, duplicate = sweep_overlaps(
+        np.array(start), np.array(end))
+    result = dict(zip(position.tolist(), zip(other.tolist(),
+                                             duplicate.tolist())))
+    assert result[2] == (0, True)
+    assert result[1] == (2, False)
+    check(start, end)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_brute_force(seed):
+    # Few distinct values, so there are plenty of ties and copies
+    rng = np.random.default_rng(seed)
+    start = rng.integers(0, 30, size=60)
+    end = start + rng.integers(0, 10, size=60)
+    check(start, end)
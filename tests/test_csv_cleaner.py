@@ -0,0 +1,98 @@
+import io
+
+import pandas as pd
+import pytest
+
+import day_index
+from csv_cleaner import (START_YEAR, clean_incremental, clean_journal,
+                         clean_streaming, file_path, output_path,
+                         update_incremental)
+from session_store import load_sessions
+from sessions import SessionArray
+
+# The cleaned journal in assets is the reference output: every way of
+# cleaning the raw journal has to give it back byte for byte.
+EXPECTED = output_path.read_bytes()
+RAW = file_path.read_bytes()
+
+
+def test_full_clean():
+    out = io.StringIO()
+    clean_journal(file_path, START_YEAR).to_csv(out, index=False)
+    assert out.getvalue().encode() == EXPECTED
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 100, 100_000])
+def test_streaming_clean(tmp_path, chunksize):
+    output = tmp_path / "cleaned.csv"
+    clean_streaming(file_path, output, START_YEAR, chunksize)
+    assert output.read_bytes() == EXPECTED
+
+
+def test_incremental_clean(tmp_path):
+    """ The journal grows a slice at a time, some slices ending in the
+        middle of a line, and each slice is cleaned incrementally
+    """
+    journal, output = tmp_path / "journal.csv", tmp_path / "cleaned.csv"
+    cuts = [len(RAW) * n // 9 for n in range(1, 9)] + [len(RAW)]
+    rebuilds = []
+    for cut in cuts:
+        journal.write_bytes(RAW[:cut])
+        rebuilds.append(clean_incremental(journal, output, START_YEAR)[1])
+    assert rebuilds == [True] + [False] * (len(cuts) - 1)
+    assert output.read_bytes() == EXPECTED
+
+
+def test_incremental_day_index(tmp_path, monkeypatch):
+    """ The day index refreshed after each slice (from the day before the
+        last indexed one on) is the one a full rebuild gives
+    """
+    journal, output = tmp_path / "journal.csv", tmp_path / "cleaned.csv"
+    rebuilds = []
+    write_day_index = day_index.write_day_index
+
+    def counted(csv_path, df):
+        rebuilds.append(len(df))
+        return write_day_index(csv_path, df)
+    monkeypatch.setattr(day_index, 'write_day_index', counted)
+    cuts = [len(RAW) * n // 13 for n in range(1, 13)] + [len(RAW)]
+    for cut in cuts:
+        journal.write_bytes(RAW[:cut])
+        update_incremental(journal, output, START_YEAR)
+        expected = day_index.build_day_index(
+            SessionArray.from_frame(load_sessions(output)))
+        pd.testing.assert_frame_equal(day_index.load_day_index(output),
+                                      expected)
+    # The first slice, and the third: the journal has a 28/08/2023 for
+    # 28/06 (row 117), so the rows after it go back in time
+    assert len(rebuilds) == 2
+    assert output.read_bytes() == EXPECTED
+
+
+def test_no_new_line_leaves_the_caches(tmp_path):
+    """ A save that only adds half a line doesn't rewrite any cache """
+    journal, output = tmp_path / "journal.csv", tmp_path / "cleaned.csv"
+    half = RAW.index(b'\n', len(RAW) // 2) + 1
+    journal.write_bytes(RAW[:half])
+    update_incremental(journal, output, START_YEAR)
+    caches = [path for path in tmp_path.iterdir()
+              if path.name.startswith("cleaned.")
+              and not path.name.endswith(".checkpoint.json")]
+    written = {path: path.stat().st_mtime_ns for path in caches}
+    journal.write_bytes(RAW[:half + 5])
+    df, rebuilt = update_incremental(journal, output, START_YEAR)
+    assert not rebuilt and df.empty
+    assert {path: path.stat().st_mtime_ns for path in caches} == written
+
+
+def test_incremental_after_full_clean(tmp_path):
+    """ A full clean in between leaves no stale checkpoint behind """
+    journal, output = tmp_path / "journal.csv", tmp_path / "cleaned.csv"
+    half = RAW[:RAW.index(b'\n', len(RAW) // 2) + 1]
+    journal.write_bytes(half[:len(half) // 2])
+    clean_incremental(journal, output, START_YEAR)
+    journal.write_bytes(half)
+    clean_streaming(journal, output, START_YEAR)
+    journal.write_bytes(RAW)
+    clean_incremental(journal, output, START_YEAR)
+    assert output.read_bytes() == EXPECTED
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+import session_store
+from day_index import (build_day_index, load_day_index, refresh_day_index,
+                       weekly, write_day_index)
+from plot_export import period_windows
+from session_store import file_path, load_sessions
+from sessions import SessionArray
+
+LINES = file_path.read_text().splitlines(keepends=True)
+
+
+def full_index(csv_path):
+    return build_day_index(SessionArray.from_frame(load_sessions(csv_path)))
+
+
+def test_sessions_back_in_time_rebuild(tmp_path):
+    """ Rows appended with days before the last indexed one can't be
+        added from that day on: the index is rebuilt
+    """
+    csv_path = tmp_path / "cleaned.csv"
+    head = LINES[:len(LINES) // 2]
+    csv_path.write_text("".join(head))
+    write_day_index(csv_path, session_store.write_cache(csv_path))
+
+    # Days from the start of the journal again
+    new_lines = LINES[1:6] + LINES[len(head):len(head) + 5]
+    with open(csv_path, 'a') as f:
+        f.write("".join(new_lines))
+    new_rows = pd.read_csv(csv_path, dtype=str).iloc[len(head) - 1:]
+    typed = session_store.append_sessions(csv_path, new_rows)
+    index = refresh_day_index(csv_path, typed)
+    pd.testing.assert_frame_equal(index, full_index(csv_path))
+    pd.testing.assert_frame_equal(load_day_index(csv_path), index)
+
+
+def test_weeks_match_the_plot_windows():
+    index = load_day_index()
+    weeks = weekly(index)
+    day = weeks.index.to_numpy().astype('datetime64[D]').astype(int)
+    windows = period_windows(SessionArray.from_frame(load_sessions()),
+                             'week')
+    # Same Mondays, the first week cut at the first indexed day
+    assert len(day) == len(windows)
+    assert windows[0][1] <= day[0] <= windows[0][2]
+    assert list(day[1:]) == [first for _, first, _ in windows[1:]]
+    assert all(np.datetime64(int(monday), 'D').item().weekday() == 0
+               for monday in day[1:])
+    assert weeks['total_minutes'].sum() == index['total_minutes'].sum()
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from parsers import minutes_or_raise, parse_dates, parse_hhmm
+
+
+def column(cells):
+    return pd.Series(cells, dtype='str', name='cells')
+
+
+def dates(cells, default_year=None):
+    parsed, bad = parse_dates(column(cells), default_year)
+    return [None if pd.isna(date) else f"{date:%Y-%m-%d}"
+            for date in parsed], list(bad)
+
+
+def test_dates():
+    parsed, bad = dates(['05/03/2024', '5/3/2024', '05//03/2024',
+                         '05/03/24', ' 29/02/2024 ', '31/12/1999'])
+    assert parsed == ['2024-03-05', '2024-03-05', '2024-03-05',
+                      '2024-03-05', '2024-02-29', '1999-12-31']
+    assert not any(bad)
+
+
+def test_dates_default_year():
+    assert dates(['05/03', '05//03', '5/3'], 2023)[0] == [
+        '2023-03-05', '2023-03-05', '2023-03-05']
+    # No year to give them
+    assert dates(['05/03', '05//03', '5/3']) == ([None] * 3, [True] * 3)
+
+
+def test_bad_dates():
+    cells = ['31/02/2024', '29/02/2023', '00/01/2020', '32/01/2020',
+             '01/13/2020', '05-03-2024', 'xx']
+    assert dates(cells) == ([None] * len(cells), [True] * len(cells))
+
+
+def test_empty_dates_are_not_bad():
+    assert dates(['05/03/2024', None, '31/02/2024']) == (
+        ['2024-03-05', None, None], [False, False, True])
+
+
+def test_all_fixed_width_dates():
+    # Every cell the same length takes the joined bytes path
+    days = np.arange(np.datetime64('1999-12-25'), np.datetime64('2025-01-05'))
+    cells = [f"{day.item():%d/%m/%Y}" for day in days]
+    parsed, bad = parse_dates(column(cells))
+    assert (parsed.to_numpy().astype('M8[D]') == days).all()
+    assert not bad.any()
+
+
+def hhmm(cells):
+    minutes, bad = parse_hhmm(column(cells))
+    return [None if pd.isna(value) else int(value)
+            for value in minutes], list(bad)
+
+
+def test_hhmm():
+    assert hhmm(['07:30', '7:30', ' 23:59', '00:00']) == (
+        [450, 450, 1439, 0], [False] * 4)
+
+
+def test_bad_hhmm():
+    cells = ['24:00', '10:75', '0730', '7:5', 'xx:yy']
+    assert hhmm(cells) == ([None] * len(cells), [True] * len(cells))
+
+
+def test_empty_hhmm_are_not_bad():
+    assert hhmm(['07:30', None, '24:00']) == (
+        [450, None, None], [False, False, True])
+
+
+@pytest.mark.parametrize('cells', [['07:30', '23:05'], ['7:30', '23:05']])
+def test_minutes_or_raise(cells):
+    assert list(minutes_or_raise(column(cells))) == [450, 1385]
+
+
+def test_minutes_or_raise_names_the_rows():
+    with pytest.raises(ValueError, match=r"'cells', rows \[1, 2\]"):
+        minutes_or_raise(column(['07:30', '24:00', None]))
@@ -0,0 +1,25 @@
+import matplotlib
+import numpy as np
+from matplotlib.collections import PolyCollection
+
+from plot_script import plot_window
+from sessions import SessionArray
+
+matplotlib.use('Agg')
+
+
+def test_first_row_gets_the_night_before():
+    # 22:00 for 8h the day before the window, then a 1h nap at 09:00
+    onset, duration = np.array([22 * 60, 9 * 60]), np.array([8 * 60, 60])
+    sessions = SessionArray.from_arrays(np.array([19000, 19001]), onset,
+                                        (onset + duration) % 1440, duration)
+    fig = plot_window(sessions, days=1)
+    [bars] = [collection for collection in fig.axes[0].collections
+              if isinstance(collection, PolyCollection)]
+    # (left, right, row) of each bar: the nap, and 00:00-06:00 in row 0,
+    # nothing from the evening part at row -1
+    spans = sorted((path.vertices[:, 0].min(), path.vertices[:, 0].max(),
+                    round(path.vertices[:, 1].mean()))
+                   for path in bars.get_paths())
+    assert spans == [(0, 360, 0), (540, 600, 0)]
+    assert fig.texts[0].get_text().endswith("Number of Sessions: 1")
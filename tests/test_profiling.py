@@ -0,0 +1,25 @@
+import profiling
+
+
+def test_nested_stages_profile_once(tmp_path, monkeypatch):
+    monkeypatch.setitem(profiling._settings, 'output', tmp_path / "p.json")
+    monkeypatch.setitem(profiling._settings, 'cprofile', True)
+    monkeypatch.setattr(profiling, '_records', [])
+    monkeypatch.setattr(profiling, '_profiles', [])
+
+    def inner_work():
+        return sum(range(1000))
+
+    with profiling.stage('outer'):
+        with profiling.stage('inner'):
+            inner_work()
+
+    assert [record['stage'] for record in profiling._records] == \
+        ['inner', 'outer']
+    # Only the outermost stage had a profiler, and it saw the inner work
+    [(seconds, name, profile)] = profiling._profiles
+    assert name == 'outer'
+    profile.create_stats()
+    assert any(function == 'inner_work'
+               for _, _, function in profile.stats)
+    assert profiling._settings['depth'] == 0
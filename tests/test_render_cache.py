@@ -0,0 +1,47 @@
+import matplotlib
+import numpy as np
+
+from render_cache import RenderCache, render_window
+from sessions import FRAGMENTED, NIGHT, SessionArray
+
+matplotlib.use('Agg')
+
+
+def sessions(onset_before):
+    """ A session the day before the window, and one at 00:30 in it """
+    onset = np.array([onset_before, 30])
+    duration = np.array([60, 200])
+    return SessionArray.from_arrays(np.array([19000, 19001]), onset,
+                                    (onset + duration) % 1440, duration)
+
+
+def test_neighbour_outside_window_changes_the_key(tmp_path):
+    # 23:00-00:00 makes the 00:30 session a fragment, 10:00-11:00 doesn't
+    late, early = sessions(23 * 60), sessions(10 * 60)
+    assert late.window_kind_codes(days=1).tolist() == [FRAGMENTED]
+    assert early.window_kind_codes(days=1).tolist() == [NIGHT]
+
+    cache = RenderCache(tmp_path)
+    render_window(late, days=1, cache=cache)
+    cached = render_window(early, days=1, cache=cache)
+    assert cached == render_window(early, days=1)
+    assert cached != render_window(late, days=1)
+
+
+def test_appending_outside_window_keeps_its_key():
+    from plot_export import period_windows
+    from render_cache import window_key
+    from session_store import load_sessions
+
+    before = SessionArray.from_frame(load_sessions())
+    # One more night, the day after the last one
+    night = np.array([(before.day[-1] + 1, 23 * 60, 7 * 60, 8 * 60)],
+                     dtype=before.records.dtype)
+    after = SessionArray(np.r_[before.records, night])
+    months = period_windows(before, 'month')
+    changed = [name for name, first, last in months
+               if window_key(before, np.datetime64(first, 'D'),
+                             np.datetime64(last, 'D'))
+               != window_key(after, np.datetime64(first, 'D'),
+                             np.datetime64(last, 'D'))]
+    assert changed == [months[-1][0]]
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from rolling_stats import METRICS, WINDOWS, RollingStats, rolling_metrics
+from session_store import load_sessions
+from sessions import SessionArray
+
+SESSIONS = SessionArray.from_frame(load_sessions())
+
+
+def as_row(metrics):
+    return np.array([metrics[window][metric] for window in WINDOWS
+                     for metric in METRICS])
+
+
+def test_incremental_matches_batch():
+    batch = rolling_metrics(SESSIONS)
+    columns = [f'{metric}_{window}' for window in WINDOWS
+               for metric in METRICS]
+    stats = RollingStats()
+    days, starts = np.unique(SESSIONS.day, return_index=True)
+    ends = np.r_[starts[1:], len(SESSIONS)]
+    for day, lo, hi in zip(days, starts, ends):
+        stats.add_day(day, SESSIONS[lo:hi])
+        expected = batch.loc[np.datetime64(int(day), 'D'), columns]
+        np.testing.assert_allclose(as_row(stats.metrics()),
+                                   expected.to_numpy(dtype=float),
+                                   rtol=1e-7, atol=1e-4)
+
+
+@pytest.mark.parametrize('slices', [3, 13, 50])
+def test_update_matches_starting_over(slices):
+    # Cut by rows, so most cuts land in the middle of a day
+    live = RollingStats()
+    for cut in np.linspace(0, len(SESSIONS), slices + 1).astype(int)[1:]:
+        live.update(SESSIONS[:cut])
+        fresh = RollingStats()
+        fresh.extend(SESSIONS[:cut])
+        np.testing.assert_allclose(as_row(live.metrics()),
+                                   as_row(fresh.metrics()), atol=1e-9)
+        assert live.last_day == fresh.last_day
+
+
+def test_update_starts_over_after_an_edit():
+    live = RollingStats()
+    live.update(SESSIONS[:500])
+    # A session removed well before the last day
+    edited = SessionArray(np.delete(SESSIONS.records, 10))
+    live.update(edited)
+    fresh = RollingStats()
+    fresh.extend(edited)
+    np.testing.assert_allclose(as_row(live.metrics()),
+                               as_row(fresh.metrics()), atol=1e-9)
@@ -0,0 +1,19 @@
+import numpy as np
+
+from session_store import (SESSION_DTYPE, file_path, load_sessions,
+                           open_arrays, write_arrays)
+from sessions import SessionArray
+
+
+def test_store_sessions_are_not_copied(tmp_path):
+    df = load_sessions(file_path)
+    write_arrays(tmp_path, {'alice': df, 'bob': df.iloc[:100]})
+    records = open_arrays(tmp_path, 'alice')
+    assert isinstance(records, np.memmap) and records.dtype == SESSION_DTYPE
+    sessions = SessionArray(records)
+    assert np.shares_memory(sessions.records, records)
+    assert np.shares_memory(sessions.window(days=30).day, records)
+    # Same sessions as the ones built from the frame
+    assert np.array_equal(sessions.records,
+                          SessionArray.from_frame(df).records)
+    assert len(SessionArray(open_arrays(tmp_path, 'bob'))) == 100
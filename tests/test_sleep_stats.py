@@ -0,0 +1,15 @@
+from sleep_stats import SleepDataset, format_stats
+
+
+def test_one_night_count():
+    dataset = SleepDataset.load()
+    nights = dataset.kinds.value_counts()['night']
+    assert dataset.night_sessions == nights
+    report = format_stats(dataset)
+    assert f"Night sleep sessions: {nights} " in report
+    assert f"night {nights}," in report
+
+
+def test_light_load_gives_the_same_report():
+    full = format_stats(SleepDataset.load())
+    assert format_stats(SleepDataset.load_light()) == full
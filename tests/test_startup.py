@@ -0,0 +1,33 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from session_store import file_path
+
+CLI = Path(__file__).parent.parent / "source" / "journal_cli.py"
+
+
+def imported(*args):
+    """ Top-level packages imported by journal_cli.py args """
+    run = subprocess.run([sys.executable, '-X', 'importtime', str(CLI)]
+                         + [str(arg) for arg in args],
+                         capture_output=True, text=True, check=True)
+    # import time: self [us] | cumulative | imported package
+    return {line.split('|')[-1].strip().split('.')[0]
+            for line in run.stderr.splitlines()
+            if line.startswith('import time:') and '|' in line}
+
+
+@pytest.mark.parametrize('command', [['--help'], ['tail'], ['validate']])
+def test_quick_commands_stay_light(command):
+    assert not imported(*command) & {'numpy', 'pandas', 'matplotlib'}
+
+
+def test_stats_text_skips_pandas_once_cached(tmp_path):
+    csv = tmp_path / "cleaned.csv"
+    shutil.copy(file_path, csv)
+    assert 'pandas' in imported('stats-text', csv)  # Writes the caches
+    assert not imported('stats-text', csv) & {'pandas', 'matplotlib'}